@@ -1,864 +1,834 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, stream_with_context
 from flask_cors import CORS
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain.output_parsers import PydanticOutputParser
-from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser
-from typing import List, Dict, Optional
+from typing import Dict
+import atexit
+import contextvars
+import functools
 import json
+import logging
+import random
+import signal
+import sys
+import tempfile
 from dotenv import load_dotenv
 import os
-from langchain.memory import ConversationBufferMemory
-import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from flask_caching import Cache
-from langchain_community.tools import DuckDuckGoSearchRun
+import prompts
+from history import HistoryManager
+from lazy import Lazy
+from metrics import counters, render_prometheus, timed, trace_turn
+from prefetch import DEFAULT_PREFETCH_QUERIES, Prefetcher
+from prompt_state import PromptStateEncoder
+from prompts import build_query
+from fast_path import OptionFastPath
+from field_index import FieldIndex
+from fields import get_options
+from router import SearchRouter
+from schedule import extract_schedule
+from search_cache import CachedSearch
+from session_store import create_session_store
+from single_flight import SingleFlight
+from state import flatten_json, initialJson, state_schema
+from streaming import NextReplyExtractor, sse_event
+from turn_cache import turn_cache_key
 
 load_dotenv()
 
 openai_api_key = os.getenv("OPEN_API_KEY")
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+api = Blueprint('api', __name__)
+
+
+def load_config(app):
+    # Session state, shared by all workers when SESSION_STORE=sqlite
+    app.config['SESSION_STORE'] = os.getenv("SESSION_STORE", "memory")  # memory | sqlite | bounded
+    app.config['SESSION_DB_PATH'] = os.getenv("SESSION_DB_PATH", "sessions.db")
+    app.config['SESSION_TIMEOUT'] = int(os.getenv("SESSION_TIMEOUT", 1800))  # Timeout in seconds (1800 seconds = 30 minutes)
+    # SESSION_STORE=bounded: byte budget for sessions in memory, idle ones compressed, the rest spilled to disk
+    app.config['SESSION_MAX_BYTES'] = int(os.getenv("SESSION_MAX_BYTES", 256 * 1024 * 1024))
+    app.config['SESSION_HOT_BYTES'] = int(os.getenv("SESSION_HOT_BYTES", 64 * 1024 * 1024))  # Uncompressed part of the budget
+    app.config['SESSION_IDLE_SECONDS'] = int(os.getenv("SESSION_IDLE_SECONDS", 300))  # Compress after this long without a turn
+    app.config['SESSION_SPILL_DIR'] = os.getenv("SESSION_SPILL_DIR", tempfile.gettempdir())  # One file per process in here; empty: evict instead of spilling
+    # memory/bounded: copy changed sessions to this SQLite file (e.g. sessions.snapshot.db) so they survive a restart; empty turns it off
+    app.config['SESSION_SNAPSHOT_PATH'] = os.getenv("SESSION_SNAPSHOT_PATH", "")
+    app.config['SESSION_SNAPSHOT_INTERVAL'] = float(os.getenv("SESSION_SNAPSHOT_INTERVAL", 5))  # Seconds between snapshots
+
+    # Opt-in cache of whole model responses for identical (recent history, state, input)
+    app.config['TURN_CACHE_ENABLED'] = os.getenv("TURN_CACHE_ENABLED", "false").lower() == "true"
+    app.config['TURN_CACHE_HISTORY'] = int(os.getenv("TURN_CACHE_HISTORY", 4))  # Messages included in the key
+    app.config['TURN_CACHE_SIZE'] = int(os.getenv("TURN_CACHE_SIZE", 1000))
+    app.config['TURN_CACHE_TTL'] = int(os.getenv("TURN_CACHE_TTL", 3600))
+
+    # Shared LLM clients
+    app.config['LLM_POOL_SIZE'] = int(os.getenv("LLM_POOL_SIZE", 20))  # Keep-alive connections to the provider
+    app.config['LLM_TIMEOUT'] = float(os.getenv("LLM_TIMEOUT", 60))  # Seconds, main gpt-4o call
+    app.config['LLM_SEARCH_CHECK_TIMEOUT'] = float(os.getenv("LLM_SEARCH_CHECK_TIMEOUT", 15))  # Seconds, gpt-4o-mini classifier
+
+    # Web search, cached per normalized query
+    app.config['SEARCH_CACHE_MAX_BYTES'] = int(os.getenv("SEARCH_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+    # Warm the search cache for a session's destinations in the background.
+    # A turn that asks one of the templates' topics about a destination is
+    # searched as the template query, so it hits the warmed entry.
+    app.config['PREFETCH_ENABLED'] = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+    app.config['PREFETCH_WORKERS'] = int(os.getenv("PREFETCH_WORKERS", 4))
+    app.config['PREFETCH_QUERIES'] = os.getenv("PREFETCH_QUERIES", ";".join(DEFAULT_PREFETCH_QUERIES))  # ";"-separated, {city} is filled in
+
+    # Decide obvious turns locally instead of asking gpt-4o-mini whether to search
+    app.config['LOCAL_SEARCH_ROUTER'] = os.getenv("LOCAL_SEARCH_ROUTER", "true").lower() == "true"
+
+    # Run the search check and a speculative no-search main call concurrently.
+    # Applies to /api/chat and /api/chat/batch; /api/chat/stream always waits
+    # for the search check, since a speculative reply would already be streamed.
+    app.config['SPECULATIVE_MAIN_CALL'] = os.getenv("SPECULATIVE_MAIN_CALL", "false").lower() == "true"
+
+    # How the state is written into the prompt: full | compact | unanswered | summary
+    app.config['PROMPT_STATE_MODE'] = os.getenv("PROMPT_STATE_MODE", "compact")
+
+    # Chat history window: recent lines verbatim, older ones folded into a summary
+    app.config['HISTORY_KEEP_LINES'] = int(os.getenv("HISTORY_KEEP_LINES", 8))  # 4 user/bot exchanges
+    app.config['HISTORY_MAX_TOKENS'] = int(os.getenv("HISTORY_MAX_TOKENS", 1500))
+    app.config['HISTORY_SUMMARIZE_EVERY'] = int(os.getenv("HISTORY_SUMMARIZE_EVERY", 4))  # Lines per summary update
+
+    # Record a clicked option and ask the next question from a template, skipping the LLM
+    app.config['OPTION_FAST_PATH'] = os.getenv("OPTION_FAST_PATH", "true").lower() == "true"
+
+    # Prefill open time_schedule_* fields from dates, times and durations parsed
+    # locally; the model sees them answered and confirms or overrides them
+    app.config['SCHEDULE_EXTRACTOR'] = os.getenv("SCHEDULE_EXTRACTOR", "true").lower() == "true"
+
+    # Fraction of turns written to the log as one JSON line with stage timings and tokens
+    app.config['TURN_LOG_SAMPLE_RATE'] = float(os.getenv("TURN_LOG_SAMPLE_RATE", 0))
+
+    # Upper bound on sessions replayed in parallel by /api/chat/batch
+    app.config['BATCH_MAX_CONCURRENCY'] = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+
+
+# Builds an app from the environment, with `config` on top, and its backends,
+# which the handlers below reach through backends(). The LLM clients and the
+# web search tool are imported and built when a turn first needs them, unless
+# passed in (tests, benchmarks). Every call makes an independent app.
+def create_app(config=None, llm_pool=None, search=None, session_store=None):
+    app = Flask(__name__)
+    CORS(app)
+    app.secret_key = 'your_secret_key'  # Replace with a secure key
+    load_config(app)
+    app.config.update(config or {})
+
+    if session_store is None:
+        session_store = create_session_store(
+            app.config['SESSION_STORE'],
+            path=app.config['SESSION_DB_PATH'],
+            timeout=app.config['SESSION_TIMEOUT'],
+            snapshot_path=app.config['SESSION_SNAPSHOT_PATH'] or None,
+            snapshot_interval=app.config['SESSION_SNAPSHOT_INTERVAL'],
+            **({
+                'max_bytes': app.config['SESSION_MAX_BYTES'],
+                'hot_bytes': app.config['SESSION_HOT_BYTES'],
+                'idle_seconds': app.config['SESSION_IDLE_SECONDS'],
+                'spill_dir': app.config['SESSION_SPILL_DIR'] or None,
+            } if app.config['SESSION_STORE'] == "bounded" else {}),
+        )
+        if hasattr(session_store, 'close'):
+            atexit.register(session_store.close)  # Final snapshot, spill file removed, on a clean exit
+
+    if llm_pool is None:
+        llm_pool = Lazy(lambda: default_llm_pool(app.config))
+    search = CachedSearch(
+        search if search is not None else Lazy(default_search),
+        max_bytes=app.config['SEARCH_CACHE_MAX_BYTES'],
+    )
+    llm_executor = ThreadPoolExecutor(max_workers=app.config['LLM_POOL_SIZE'])
+
+    app.extensions['travel_planner'] = Backends(
+        session_store=session_store,
+        turn_cache=Cache(app, config={
+            'CACHE_TYPE': 'SimpleCache',
+            'CACHE_THRESHOLD': app.config['TURN_CACHE_SIZE'],
+            'CACHE_DEFAULT_TIMEOUT': app.config['TURN_CACHE_TTL'],
+        }),
+        llm_pool=llm_pool,
+        search=search,
+        prefetcher=Prefetcher(
+            search,
+            queries=[query.strip() for query in app.config['PREFETCH_QUERIES'].split(";") if query.strip()],
+            max_workers=app.config['PREFETCH_WORKERS'],
+        ),
+        llm_executor=llm_executor,
+        history_manager=HistoryManager(
+            functools.partial(summarize_history, app),
+            session_store,
+            llm_executor,
+            keep_lines=app.config['HISTORY_KEEP_LINES'],
+            max_tokens=app.config['HISTORY_MAX_TOKENS'],
+            summarize_every=app.config['HISTORY_SUMMARIZE_EVERY'],
+        ),
+        # Duplicate in-flight turns (retries, double clicks) share one run; other turns queue per user
+        turn_flights=SingleFlight(),
+    )
+    app.register_blueprint(api)
+    return app
 
-search = DuckDuckGoSearchRun()
 
+# The stateful objects one app's handlers run on, kept in
+# app.extensions['travel_planner'] by create_app().
+class Backends:
+    def __init__(self, session_store, turn_cache, llm_pool, search, prefetcher, llm_executor, history_manager, turn_flights):
+        self.session_store = session_store
+        self.turn_cache = turn_cache
+        self.llm_pool = llm_pool
+        self.search = search
+        self.prefetcher = prefetcher
+        self.llm_executor = llm_executor
+        self.history_manager = history_manager
+        self.turn_flights = turn_flights
 
-class FieldUpdate(BaseModel):
-    field_name: str
-    answer: str
 
-class ResponseStructure(BaseModel):
-    inferences: Optional[List[FieldUpdate]] = None
-    next_reply: str
-    metadata:str
-    reason:str
-    # internet_search_required: bool = Field(default=False, description="Flag indicating if internet search is required")
-    # online_search_query: Optional[str] = Field(default=None, description="Query to search online for better GPT-4 responses")
+# Backends of the app handling the current request (or app context).
+def backends():
+    return current_app.extensions['travel_planner']
 
 
-# Define your model for parsing the output
-class InternetSearchRequired(BaseModel):
-    internet_search_required: bool = Field(default=False, description="Flag indicating if internet search is required")
-    online_search_query: Optional[str] = Field(default=None, description="Query to search online for better GPT-4 responses")
+def default_llm_pool(config):
+    from llm_clients import LLMClientPool
 
+    return LLMClientPool(
+        openai_api_key,
+        pool_size=config['LLM_POOL_SIZE'],
+        timeout=config['LLM_TIMEOUT'],
+    )
 
 
+def default_search():
+    from langchain_community.tools import DuckDuckGoSearchRun
 
-app = Flask(__name__)
-CORS(app)
+    return DuckDuckGoSearchRun()
 
-# Configure cache
-app.config['CACHE_TYPE'] = 'SimpleCache'  # Change to 'redis' if using Redis
-app.config['CACHE_DEFAULT_TIMEOUT'] = 1800  # Timeout in seconds (1800 seconds = 30 minutes)
 
-cache = Cache(app)
+# Runs on the history executor, outside any app context, so it is bound to
+# its app by create_app().
+def summarize_history(app, summary, lines):
+    from langchain_core.output_parsers import StrOutputParser
 
+    model = app.extensions['travel_planner'].llm_pool.get("gpt-4o-mini", 0, timeout=app.config['LLM_TIMEOUT'])
+    chain = prompts.history_summary_prompt | model | StrOutputParser()
+    return chain.invoke({"summary": summary or "(none yet)", "lines": "\n".join(lines)}).strip()
 
 
-app.secret_key = 'your_secret_key'  # Replace with a secure key
-cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})  # Use SimpleCache for in-memory
+# Stateless helpers, the same for every app
 
+# Decide obvious turns locally instead of asking gpt-4o-mini whether to search
+search_router = SearchRouter()
 
-initialJson = {
-    "Origin_city": {},
-    "budget": {},
-    "destination": [],
-    "firstDestination": {},
-    "food": {},
-    "optimizeType": {},
-    "time_schedule": {
-      "duration": {
-        "unit": {},
-        "value": {}
-      },
-      "onward_trip": {
-        "date": {
-          "day_of_month": {},
-          "month": {},
-          "year": {}
-        },
-        "time": {
-          "hour": {},
-          "minute": {}
-        }
-      },
-      "return_trip": {
-        "date": {
-          "day_of_month": {},
-          "month": {},
-          "year": {}
-        },
-        "time": {
-          "hour": {},
-          "minute": {}
-        }
-      }
-    },
-    "traveller_type": {},
-    "trip_direction": {},
-    "trip_theme": {},
-    "user_interests": {
-      "adult": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "any": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "beach": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "city-sightseeing": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "culture and traditions": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "dark tourism": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "food and wine": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "historical": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "kids entertainment": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "nature": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "nightlife": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "outdoors and sports": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "religion": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "science and technology": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "shopping": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      },
-      "theatre and concert": {
-        "places": [],
-        "user_keywords": [],
-        "user_selected": False,
-        "weight": 0
-      }
-    }
-  }
+# How the state is written into the prompt (PROMPT_STATE_MODE)
+prompt_state_encoder = PromptStateEncoder()
+
+# Field names, options, aliases and ranges that model inferences are checked against
+field_index = FieldIndex()
+
+# Record a clicked option and ask the next question from a template, skipping the LLM
+option_fast_path = OptionFastPath()
+
+
+NO_SEARCH = {"internet_search_required": False, "online_search_query": None}
 
 initial_message = ["Bot: Hello! I am here to help you plan your vacation. Let's get started! Where are you planning to visit this time for vacation?"]
 
 
-@app.route('/api/initialize', methods=['POST'])
+@api.route('/api/initialize', methods=['POST'])
 def initialize():
     data = request.json
     user_id = data.get('userId', '')
 
-    print("++++++++++++++",user_id,"++++++++++++++")
 
 
     if not user_id:
         return jsonify({'error': 'User ID is required'}), 400
 
-    if not cache.get(user_id):
-        cache.set(user_id, {
+    user_data = load_or_create_session(user_id)
+    return jsonify(session_response(user_data))
+
+
+
+@api.route('/api/end', methods=['POST'])
+def end():
+    data = request.json
+    user_id = data.get('userId', '')
+
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+
+    end_session(user_id)
+    return jsonify({'ended': True})
+
+
+def end_session(user_id):
+    backends().prefetcher.cancel(user_id)
+    backends().session_store.delete(user_id)
+
+
+def load_or_create_session(user_id):
+    def create(user_data):
+        if user_data is not None:
+            return None
+        return {
             'chat_history': initial_message,
-            'current_json': initialJson,
+            'state': [],
             "options": []
-        })
+        }
+
+    session_store = backends().session_store
+    return session_store.update(user_id, create) or session_store.get(user_id)[1]
 
-    user_data = cache.get(user_id)
-    return jsonify({
+
+def session_response(user_data):
+    return {
         'chat_history': user_data['chat_history'],
-        'current_json': user_data['current_json'],
-        "options": user_data['options']
-    })
+        'current_json': session_state(user_data).nested(),
+        "options": user_data['options'],
+        "state_version": user_data.get('state_version', 0)
+    }
 
 
+# Sessions store only the answered fields, as [[flat key, value], ...] under
+# 'state'; ones written before that carry the whole nested 'current_json'.
+def session_state(user_data):
+    if 'state' in user_data:
+        return state_schema.load(user_data['state'])
+    return state_schema.sparse(flatten_json(user_data['current_json']))
 
-@app.route('/api/chat', methods=['POST'])
+
+# Prompt history for a turn: the stored lines plus the new user input.
+def turn_history(user_id, user_data, user_input):
+    with timed("history"):
+        return backends().history_manager.window(user_id, {
+            **user_data,
+            'chat_history': user_data['chat_history'] + [f"User: {user_input}"],
+        })
+
+
+# Option-button clicks answered without a model call; None for every other turn.
+def option_reply(user_data, flat_json, user_input):
+    shown_options = user_data.get('options') or []
+    if not current_app.config['OPTION_FAST_PATH'] or not shown_options:
+        return None
+    with timed("fast_path"):
+        response = option_fast_path.respond(user_input, shown_options, flat_json)
+    counters.inc("option_fast_path_hits" if response is not None else "option_fast_path_misses")
+    return response
+
+
+# Writes the dates, times and durations found locally in the input into the
+# flat state. Only fields that are still open are filled, so the model sees
+# them answered and only has to confirm them, or override them through its
+# inferences.
+def prefill_schedule(flat_json, user_input):
+    if not current_app.config['SCHEDULE_EXTRACTOR']:
+        return
+    with timed("schedule"):
+        found = extract_schedule(user_input, flat_json)
+    if found:
+        flat_json.update(found)
+        counters.inc("schedule_turns")
+        counters.inc("schedule_fields", len(found))
+
+
+def log_turn(user_id, trace, status):
+    rate = current_app.config['TURN_LOG_SAMPLE_RATE']
+    if rate <= 0 or random.random() >= rate:
+        return
+    logger.info(json.dumps({
+        "event": "turn",
+        "user_id": user_id,
+        "status": status,
+        "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in trace["stages"].items()},
+        "tokens": {model: {"prompt": prompt, "completion": completion} for model, (prompt, completion) in trace["tokens"].items()},
+    }))
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+
+@api.route('/api/chat', methods=['POST'])
 def chat():
     data = request.json
     user_input = data.get('userInput', '')
     user_id = data.get('userId', '')
 
-    print("++++++++++++++",user_id,"++++++++++++++",user_input,"++++++++++++++")
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+    
+    # Retrieve the current chat history and json data for the user. This
+    # happens once the turn is first in its user's queue, so it sees what the
+    # previous turn stored.
+    def turn():
+        version, user_data = backends().session_store.get(user_id)
+        if user_data is None:
+            return None
+        return run_turn(user_id, version, user_data, user_input, data.get('stateVersion'))
 
+    try:
+        reply = backends().turn_flights.run(user_id, user_input, turn)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if reply is None:
+        return jsonify({'error': 'Session not found, call /api/initialize first'}), 404
+    return jsonify(reply)
+
+
+# One chat turn against a session read at `version`: build the prompt history,
+# call the model, store the result. Shared by chat() and chat_batch().
+def run_turn(user_id, version, user_data, user_input, client_version=None):
+    with trace_turn() as trace:
+        status = "ok"
+        try:
+            with timed("turn"):
+                with timed("flatten"):
+                    flat_json = session_state(user_data).flat()
+
+                response = option_reply(user_data, flat_json, user_input)
+                if response is not None:
+                    current_json, next_reply, options = apply_response(flat_json, response)
+                else:
+                    prefill_schedule(flat_json, user_input)
+                    history = turn_history(user_id, user_data, user_input)
+                    current_json, next_reply, options = call_openai_api(history, flat_json, user_input)
+
+                state = save_turn(user_id, version, user_data, user_input, current_json, next_reply, options, client_version)
+
+            # # Update the session data
+            # session[user_id] = {
+            #     'chat_history': chat_history,
+            #     'current_json': current_json
+            # }
+
+            return {
+                **state,
+                "next_reply": next_reply,
+                "options": options
+            }
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            log_turn(user_id, trace, status)
+
+
+# Replays many scripted conversations, e.g. to evaluate a prompt change:
+#
+#   {"sessions": [{"userId": "eval-1", "turns": ["hello", "Paris", ...]}, ...],
+#    "concurrency": 8, "reset": true}
+#
+# Sessions run side by side (at most BATCH_MAX_CONCURRENCY), the turns of one
+# session strictly in order, through the same run_turn() and session store as
+# /api/chat. Each userId may appear once, and its stored session is only
+# cleared first when "reset" is true. The response is NDJSON with one line per
+# session, written as each session finishes. A failure ends only its own
+# session, with an "error" field on its line.
+@api.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    data = request.json or {}
+    scripts = data.get('sessions')
+    if not isinstance(scripts, list) or not all(
+        isinstance(script, dict) and script.get('userId') and isinstance(script.get('turns', []), list)
+        and all(isinstance(turn, str) for turn in script.get('turns', []))
+        for script in scripts
+    ):
+        return jsonify({'error': 'sessions must be a list of {"userId", "turns": [str, ...]}'}), 400
+
+    user_ids = [script['userId'] for script in scripts]
+    if len(set(user_ids)) != len(user_ids):
+        return jsonify({'error': 'each userId may appear only once in a batch'}), 400
+
+    try:
+        concurrency = int(data.get('concurrency', current_app.config['BATCH_MAX_CONCURRENCY']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'concurrency must be an integer'}), 400
+    concurrency = max(1, min(concurrency, current_app.config['BATCH_MAX_CONCURRENCY']))
+    reset = data.get('reset', False)
+
+    def generate():
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, replay_session, index, script, reset)
+                for index, script in enumerate(scripts)
+            ]
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def replay_session(index, script, reset):
+    user_id = script['userId']
+    result = {"index": index, "userId": user_id, "turns": []}
+    try:
+        if reset:
+            end_session(user_id)
+        load_or_create_session(user_id)
+
+        for user_input in script.get('turns', []):
+            version, user_data = backends().session_store.get(user_id)
+            reply = run_turn(user_id, version, user_data, user_input)
+            result["turns"].append({"userInput": user_input, **reply})
+    except Exception as e:
+        result["error"] = str(e)
 
+    counters.inc("batch_sessions")
+    counters.inc("batch_turns", len(result["turns"]))
+    return result
+
+
+
+@api.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json
+    user_input = data.get('userInput', '')
+    user_id = data.get('userId', '')
+    client_version = data.get('stateVersion')
 
     if not user_id:
         return jsonify({'error': 'User ID is required'}), 400
-    
-    # Retrieve the current chat history and json data for the user
-    user_data = cache.get(user_id)
-    chat_history = user_data['chat_history']
-    current_json = user_data['current_json']
-
-    chat_history.append(f"User: {user_input}")
-
-    messages = [{"role": "system", "content": "You are a helpful assistant."}]
-    for chat in chat_history:
-        if chat.lower().startswith('user:'):
-            role = "user"
-            content = chat.split(': ', 1)[1]  # Remove "User:" from the content
-        elif chat.lower().startswith('bot:'):
-            role = "assistant"
-            content = chat.split(': ', 1)[1]  # Remove "Bot:" from the content
+
+    if backends().session_store.get(user_id)[1] is None:
+        return jsonify({'error': 'Session not found, call /api/initialize first'}), 404
+
+    # Same pipeline as chat(), but the main completion is streamed: "token"
+    # events carry next_reply as it is generated, "done" carries the final state.
+    # A duplicate of a turn already in flight, or a turn cache hit, gets its
+    # reply as one token.
+    def generate():
+        with backends().turn_flights.claim(user_id, user_input) as flight:
+            if not flight.leader:
+                try:
+                    reply = flight.result()
+                except Exception as e:
+                    yield sse_event("error", {"error": str(e)})
+                    return
+                yield sse_event("token", {"text": reply["next_reply"]})
+                yield sse_event("done", reply)
+                return
+
+            with trace_turn() as trace:
+                status = "ok"
+                try:
+                    with timed("turn"):
+                        version, user_data = backends().session_store.get(user_id)
+                        if user_data is None:
+                            raise LookupError("Session not found, call /api/initialize first")
+                        with timed("flatten"):
+                            flat_json = session_state(user_data).flat()
+
+                        response = option_reply(user_data, flat_json, user_input)
+                        if response is not None:
+                            yield sse_event("token", {"text": response["next_reply"]})
+                        else:
+                            prefill_schedule(flat_json, user_input)
+                            history = turn_history(user_id, user_data, user_input)
+                            key, response = cached_response(history, flat_json, user_input)
+                            if response is not None:
+                                yield sse_event("token", {"text": response.get("next_reply", "")})
+                            else:
+                                chain, inputs = prepare_main_call(history, flat_json, user_input)
+
+                                extractor = NextReplyExtractor()
+                                with timed("main_llm"):
+                                    for chunk in chain.stream(inputs):
+                                        text = extractor.feed(chunk.content)
+                                        if text:
+                                            yield sse_event("token", {"text": text})
+
+                                with timed("parse"):
+                                    response = prompts.response_parser.parse(extractor.buffer)
+                                cache_response(key, response, "search_results" in inputs)
+                        new_json, next_reply, options = apply_response(flat_json, response)
+
+                        state = save_turn(user_id, version, user_data, user_input, new_json, next_reply, options, client_version)
+
+                    reply = {
+                        **state,
+                        "next_reply": next_reply,
+                        "options": options
+                    }
+                    flight.set_result(reply)
+                    yield sse_event("done", reply)
+                except Exception as e:
+                    status = "error"
+                    flight.set_exception(e)
+                    yield sse_event("error", {"error": str(e)})
+                finally:
+                    log_turn(user_id, trace, status)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+# Appends the exchange and stores the new state with a compare-and-swap on the
+# version the turn started from. If another turn for the same user got there
+# first, the lines are appended to its history and only the fields this turn
+# changed are applied on top of its state.
+#
+# current_json carries a state_version that goes up whenever it changes. The
+# return value is what the client needs to catch up: a JSON patch when it says
+# it holds the version this turn was applied to, the full document otherwise.
+# new_json is the turn's flat state; the nested document is only built for
+# the full-document reply.
+def save_turn(user_id, version, user_data, user_input, new_json, next_reply, options, client_version=None):
+    before = session_state(user_data).flat()
+    changed = {key: value for key, value in new_json.items() if before.get(key) != value}
+    new_state = state_schema.sparse(new_json)
+    state = {}
+
+    def record(data):
+        if data is None:
+            data = {'chat_history': initial_message, 'state': []}
+        base_state = session_state(data)
+        base_version = data.get('state_version', 0)
+
+        if data is not user_data:
+            merged = base_state.flat()
+            merged.update(changed)
+            current = state_schema.sparse(merged)
         else:
-            # Default role or handle cases where prefix is not recognized
-            role = "user"
-            content = chat
-        
-        messages.append({"role": role, "content": content})
-    
-    try:
-        current_json, next_reply, options = call_openai_api(messages, flatten_json(current_json), user_input)
+            current = new_state
+        if current.fields != base_state.fields:
+            data['state_version'] = base_version + 1
+
+        data.pop('current_json', None)
+        data['state'] = current.dump()
+        data['chat_history'] = data['chat_history'] + [f"User: {user_input}", f"Bot: {next_reply}"]
+        data['options'] = options
+
+        state.clear()
+        state['state_version'] = data.get('state_version', 0)
+        if client_version is not None and client_version == base_version:
+            state['current_json_patch'] = state_schema.patch(base_state, current)
+        else:
+            state['current_json'] = current.nested()
+        return data
 
-        # Append the response to chat history
-        chat_history.append(f"Bot: {next_reply}")
+    with timed("session_write"):
+        backends().session_store.update(user_id, record, version=version, data=user_data)
+    if 'current_json_patch' in state:
+        counters.inc("state_patches")
+    else:
+        counters.inc("state_full")
 
-        cache.set(user_id, {
-            'chat_history': chat_history,
-            'current_json': current_json,
-            "options": options
-        })
+    if current_app.config['PREFETCH_ENABLED'] and ('destination' in changed or 'firstDestination' in changed):
+        backends().prefetcher.prefetch(user_id, destination_cities(changed))
+    return state
 
-        # # Update the session data
-        # session[user_id] = {
-        #     'chat_history': chat_history,
-        #     'current_json': current_json
-        # }
 
-        return jsonify({
-            "current_json": current_json,
-            "next_reply": next_reply,
-            "options": options
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+def destination_cities(flat_json):
+    cities = list(flat_json.get('destination') or [])
+    first = flat_json.get('firstDestination')
+    if isinstance(first, str) and first and first not in cities:
+        cities.insert(0, first)
+    return [city for city in cities if isinstance(city, str) and city.strip()]
 
 
 
 def call_openai_api(chat_history, current_json, user_input):
-    print("/////////////////////////////",chat_history,"//////////////////////////")
+    key, response = cached_response(chat_history, current_json, user_input)
+    if response is not None:
+        return apply_response(current_json, response)
 
-    model = ChatOpenAI(api_key=openai_api_key, temperature=1, model="gpt-4o")
-    # model = ChatOpenAI(api_key=openai_api_key, temperature=0)
+    if current_app.config['SPECULATIVE_MAIN_CALL']:
+        response, searched = speculative_main_call(chat_history, current_json, user_input)
+    else:
+        chain, inputs = prepare_main_call(chat_history, current_json, user_input)
+        response = invoke_main_chain(chain, inputs)
+        searched = "search_results" in inputs
 
-    # Define the parser
-    parser = JsonOutputParser(pydantic_object=ResponseStructure)
-
-    details = {
-        "fields": [
-            {
-                "field_name": "optimizeType",
-                "question": "Would you prefer to sequence the list of cities manually, or should we auto-sequence them for you?",
-                "options": ["manual", "auto"]
-            },
-            {
-                "field_name": "firstDestination",
-                "question": "Where would you like to go first?"
-            },
-            {
-                "field_name": "trip_theme",
-                "question": "What is the theme of your trip (e.g., adventure, beach, cultural)?",
-                "options": [
-                    "romantic",
-                    "family-vacation",
-                    "eco-tourism",
-                    "party",
-                    "roadtrip",
-                    "remote-work",
-                    "business-work",
-                    "health and wellness",
-                    "spiritual",
-                    "lbgtq+",
-                    "adventure",
-                    "general-tourism-no-theme"
-                ]
-            },
-            {
-                "field_name": "destination",
-                "question": "Could you provide the list of destinations you plan to visit?",
-                "instruction": "this will be a list so even in inference give back a list. if the user updates this then also give the final list in inference as whatever you give will be replaced with previous value"
-            },
-            {
-                "field_name": "traveller_type",
-                "question": "What type of traveler are you (e.g., solo, family, friends)?",
-                "options": [
-                    "solo",
-                    "couple",
-                    "family-no kids",
-                    "family-with kids",
-                    "friends"
-                ]
-            },
-            {
-                "field_name": "Origin_city",
-                "question": "What is your city of origin?"
-            },
-            {
-                "field_name": "budget",
-                "question": "How would you describe your budget for this trip?",
-                "options": [
-                    "on a tight budget",
-                    "comfortable spending",
-                    "happy to spend for a luxurious vacation"
-                ]
-            },
-            {
-                "field_name": "food",
-                "question": "Do you have any dietary preferences?",
-                "options": [
-                    "any",
-                    "Middle-eastern",
-                    "indian",
-                    "asian",
-                    "european",
-                    "mexican",
-                    "vegetarian",
-                    "south american",
-                    "vegan",
-                    "seafood",
-                    "fast food",
-                    "cafe",
-                    "dessert",
-                    "healthy",
-                    "bar/pub",
-                    "barbeque",
-                    "pizza"
-                ]
-            },
-            {
-                "field_name": "trip_direction",
-                "question": "Is your trip one-way or round-trip?",
-                "options": ["return", "oneway"]
-            },
-            {
-                "field_name": "time_schedule_onward_trip_time_hour",
-                "question": "At what time would you like to depart?",
-                "value_option":  ["AM/PM" , "24Hour"],
-                "instructions": "user needs to specify if the time is in am or pm or in 24 hour format if you cannot infer this then ask user for clarification"
-            },
-            {
-                "field_name": "time_schedule_onward_trip_time_minute",
-                "question": "Minute:"
-            },
-            {
-                "field_name": "time_schedule_onward_trip_date_day_of_month",
-                "question": "Day of the month:",
-                "options": [1, 31]
-            },
-            {
-                "field_name": "time_schedule_onward_trip_date_month",
-                "question": "Month:",
-                "options": [1, 12]
-            },
-            {
-                "field_name": "time_schedule_onward_trip_date_year",
-                "question": "Year:",
-                "options": ["current_year", "next_year"]
-            },
-            {
-                "field_name": "time_schedule_return_trip_time_hour",
-                "question": "At what time would you like to depart?",
-                "value_option":  ["AM/PM" , "24Hour"],
-                "instructions": "user needs to specify if the time is in am or pm or in 24 hour format if you cannot infer this then ask user for clarification"
-            },
-            {
-                "field_name": "time_schedule_return_trip_time_minute",
-                "question": "Minute:"
-            },
-            {
-                "field_name": "time_schedule_return_trip_date_day_of_month",
-                "question": "Day of the month:",
-                "options": [1, 31]
-            },
-            {
-                "field_name": "time_schedule_return_trip_date_month",
-                "question": "Month:",
-                "options": [1, 12]
-            },
-            {
-                "field_name": "time_schedule_return_trip_date_year",
-                "question": "Year:",
-                "options": ["current_year", "next_year"]
-            },
-            {
-                "field_name": "time_schedule_duration_value",
-                "question": "Duration value:"
-            },
-            {
-                "field_name": "time_schedule_duration_unit",
-                "question": "Duration unit:",
-                "options": ["week", "month", "days"]
-            },
-            {
-                "field_name": "user_interest_interest-name",
-                "instructions": "Observe the conversation context and user input to infer the user's general interests for the trip. Set appropriate values for weight, user_selected, places, and user_keywords based on the discussion. Remember each field which you set true will start with an innitial weight of 0.5 and wiill increase by 0.1 every if user shows more interest in it (if he metions it again or says something to  indicates that he is more interested in that field. also allow the user to update the it anything they like. also in th ekeywords you have to records that user said that shows his interest in that) also if the user mentions any specific places regarding that then they should be in the respective places list field"
-            }
-        ]
-    }
+    cache_response(key, response, searched)
 
+    return apply_response(current_json, response)
 
-    query = f"""
-
-            You are a travel assistant chatbot. Your name is Travel.AI, and you are designed to help users plan their trips and provide travel-related information. First, you need to get some information from the user. You will receive the current conversation history and a JSON template with the questions that need to be filled based on user inputs.
-
-            You have to interact with the user as a customer service agent and get them to answer questions in order to fill the question JSON template. Ensure your responses are polite, engaging, and context-aware, using natural language to guide the user through the necessary details. Here are some key points to remember:
-
-         
-            1. Engage politely, analyze chat history, and provide informative responses.
-            2. Analyze chat history carefully before responding, providing inferences only when appropriate.
-            3. Each response should be informative and contain at least 20 words.
-            4. If the user seems confused or requests suggestions then respond accordingly and guide them. base your suggestion on the questions already answered.
-            5. If the user refuses to answer, skip the question and try again later in a different way. if user skips again then mention how important it is to get that data for you and try to convince user.
-            6. Allow for updates and deletions of answers.
-            7. Only give inferences when you have the answer; do not guess. If needed ask user for clarification in your next reply. also if you cannot match the answer to the value options then ask the user to clarify
-            8. Clearly state reasons for inferences or why you're not providing one.
-            9. For questions with options, specify the field name accurately in metadata; avoid providing options in next_reply.
-            10. if the user provided the start and end date and time of the trip then be smart enought to calculate the duration. and if you need clarification then ask for it in next reply.
-            11. keep an eye on the user latest input to fill user interest fields( that start with user_interest as the prefix) accordingly as explained in the details.
-            12. never ask the questions for which a clear answer is already present. only if you wish to clarify it then you can ask
-            13. be extra careful when asking for date and time. you can club those questions together.
-            14. Update user interest fields based on user inputs and instructions mentioned in details json below.
-            15. also if user selects manual sequencing then ask him to write the cities name in order and in the inferences give the answer in the same order 
-            16. At the end of the chat confirm and clarify with the user the interested you have collected so far. and if the interests are not collected then ask user his interests.
-            17. if the user is normally greeting like saying hi hello then greet them normally and introduce yourself (intro is important) say You are a travel assistant chatbot named Travel.AI, designed to help users plan their trips and provide travel-related information and how you need some info to do that.
-            18. Ensure all fields are answered before saying "Thank you, I have all I need for now."
-            19. finally the most important thing is that your order and time of asking each question should not be ambigious. it should make sense, if the user is asking about a place or any other thing then resolve that first and ask the user if he have any more query. and only after the user's query has been answered then from there keeping the context in mind ask the next question in a relevant wany. dont just answer and ask the next question that is irrelevant. interact just like an professional customer support helping and guiding the user along
-
-            always ask the questions in a logically sensible way
-
-
-            Details on each field and how to ask questions: {json.dumps(details, indent=4)}
-
-            Please ensure responses are informative, accurate, and tailored to the user's queries and preferences. Use natural language to engage users and provide a seamless experience throughout their travel planning journey.
-
-            Below are a few examples for you to learn how to do it:
-
-            
-            Examples:
-                Bot: Hello! I am here to help you plan your vacation. Let's get started! Where are you planning to go for vacation this time?
-                User: hello.
-
-                {{
-                    "inferences": [],
-                    "next_reply": "Hi there! It's nice to meet you. I'm Travel.AI, your travel assistant. I'm here to help you plan your trip. Could you please tell me where you would like to go first?",
-                    "metadata": "firstDestination",
-                    "reason": "The user greeted the assistant. The assistant introduced itself and asked the first question to start the travel planning process."
-                }}
-
-                User: I want to visit several cities in Europe.
-                {{
-                    "inferences": [],
-                    "next_reply": "Great! Can you list the cities you plan to visit?",
-                    "metadata": "none",
-                    "reason": "User mentioned visiting several cities, asking for a list."
-                }}
-
-                User: Paris, Rome, and Barcelona.
-                {{
-                    "inferences": [
-                        {{"field_name": "destination", "answer": ["Paris", "Rome", "Barcelona"]}}
-                    ],
-                    "next_reply": "Do you want to manually sequence the cities you will visit, or should we auto-sequence it?",
-                    "metadata": "none",
-                    "reason": "User provided list of cities: Paris, Rome, Barcelona."
-                }}
-
-                User: Let's auto-sequence it.
-                {{
-                    "inferences": [
-                        {{"field_name": "optimizeType", "answer": "auto"}}
-                    ],
-                    "next_reply": "What is your origin city for this trip?",
-                    "metadata": "none",
-                    "reason": "User chose auto-sequencing."
-                }}
-
-                User: I will start from New York.
-                {{
-                    "inferences": [
-                        {{"field_name": "Origin_city", "answer": "New York"}}
-                    ],
-                    "next_reply": "How would you describe your budget for this trip? Please choose from: 'on a tight budget', 'comfortable spending', 'happy to spend for a luxurious vacation'.",
-                    "metadata": "budget",
-                    "reason": "User mentioned New York as the origin city."
-                }}
-
-                User: Comfortable spending.
-                {{
-                    "inferences": [
-                        {{"field_name": "budget", "answer": "comfortable spending"}}
-                    ],
-                    "next_reply": "Do you have any dietary preferences or restrictions? Please choose from: 'any', 'Middle-eastern', 'indian', 'asian', 'european', 'mexican', 'vegetarian', 'south american', 'vegan', 'seafood', 'fast food', 'cafe', 'dessert', 'healthy', 'bar/pub', 'barbeque', 'pizza'.",
-                    "metadata": "food",
-                    "reason": "User chose 'comfortable spending' as budget."
-                }}
-
-                User: I prefer European cuisine.
-                {{
-                    "inferences": [
-                        {{"field_name": "food", "answer": "european"}}
-                    ],
-                    "next_reply": "What is your preferred start date and time of your trip?",
-                    "metadata": "none",
-                    "reason": "User prefers European cuisine."
-                }}
-
-
-            Remember these are just examples for you to learn. do not use this example data in real inferences
-            and also remember that if user selects manula sequencing then ask him the order of his visit and arrange them in the same order in your response inferences. 
-            if only one city is given ask the user to clarify if he is visiting only one city. if yes then also set sequencing to manual and no need to prompt the user for that.
-            Also the first destination is also a destination so it should be added to destination list also
-            also the sequencing related questions should be asked only after the user has given the cities. and is visiting multiple cities
-           
-            Chat history:
-            {chat_history}
-
-            Questions that need to be answered (some of them have been answered; focus on those that are still not answered):
-            {json.dumps(current_json, indent=4)}
-
-            your output json should have this structure :
-
-            {{
-                "inferences": [ your inferences based on th euser input],
-                "next_reply": "next reply to give to the user",
-                "metadata": "this will contain the field name of the question you are asking in the next_reply if that field has value options to choose from. if you are suggestion and not asking any question from the current json then just state 'none' here", also this value should be none for user interest fields,
-                "reason": "here you have to give your reasons for whatever inference you gave along with latest user input. example - i am giving inference for destination to be tokyo as the user mentioned tokyo in this latest input ie. 'i wish to to to tokyo' and if you are leaving the inference empty then state why so"
-            }}
-
-            also you can give inferences even for a one word answer based on the context from the chat_hist0ry
-
-            just be extra careful when filling time no matter in what format the user enters time you have to always convert it to 24 hour format. and be smart enough to infer minutes as 00 when the user just only provides the hours
-
-
-            And finally the most important thing is you have the value options provided in the details json so make sure for the questions with value options you only infer the answer from among those options. if you cannot do that then ask user for clarification or you can also ask him to select themselves
-
-            just give me the json structured output nothing else
-
-            you have to answer every user query unless it is entirely on a different domain than the or travel use case. for example you have to answer if user asks you to find the hotels, flights, routes, or if he asks about what is the current time or any travel related news. under any circumstances you have to answer that
-
-            if the user is asking something that is not related to travel then you dont need to preform internet search as it is not in our domain
-
-            """
+
+# Turn-level response cache lookup; key is None when the cache is off.
+def cached_response(chat_history, current_json, user_input):
+    if not current_app.config['TURN_CACHE_ENABLED']:
+        return None, None
+
+    key = turn_cache_key(chat_history, current_json, user_input, current_app.config['TURN_CACHE_HISTORY'])
+    response = backends().turn_cache.get(key)
+    counters.inc("turn_cache_hits" if response is not None else "turn_cache_misses")
+    return key, response
+
+
+def cache_response(key, response, searched):
+    # Replies built on web results go stale, so only cache the others
+    if key is not None and not searched:
+        with timed("cache_write"):
+            backends().turn_cache.set(key, response)
+
+
+def build_prompt_query(chat_history, current_json):
+    return build_query(
+        chat_history,
+        prompt_state_encoder.encode(current_json, current_app.config['PROMPT_STATE_MODE']),
+    )
+
+
+# Runs the search check (and the search itself when needed) and returns the
+# prompt | model chain for the main call plus its inputs, without invoking it.
+def prepare_main_call(chat_history, current_json, user_input):
+    query = build_prompt_query(chat_history, current_json)
     
-    internet = gpt_call_with_internet_search(user_input, current_json)
-    print("*****************",internet,"***************")
-    print("=====================================================")
+    internet = check_search_needed(user_input, current_json)
+
+    return main_call(query, internet)
 
+
+def main_call(query, internet):
+    search_results = None
     if internet['internet_search_required']:
-    # Define the prompt template
-        print("=====================================================")
+        with timed("search"):
+            search_results = backends().search.run(internet['online_search_query'])
+
+    return main_chain(query, internet, search_results)
+
+
+def main_chain(query, internet, search_results=None):
+    model = backends().llm_pool.get("gpt-4o", 1, timeout=current_app.config['LLM_TIMEOUT'])
+    # model = ChatOpenAI(api_key=openai_api_key, temperature=0)
+
+    if search_results is not None:
         online_search_query = internet['online_search_query']
-        search_results = search.run(online_search_query)
-        print("here is the online data   :   ", search_results)
-        prompt = PromptTemplate(
-            template="""Answer the user query.\n{query}\n\n\n\n    below is the internet search results for the query {online_search_query} so kindly use it as a knowledge context only , Remember this is not the user's reply so do not include any inference from the below text at any cost (most important \n\n\n\n  {search_results}) \n\n Remember you have to give a detailed answer to the user's query using the above data. if you cannot answer or if the data is for internet search is not sufficient just say "i data from internet is not sufficient to answer that query" answer the query no matter what  """,
-            input_variables=["query"],
-            partial_variables={"format_instructions": parser.get_format_instructions()},
-        )
-        chain = prompt | model | parser
-        response = chain.invoke({"query":query, "search_results":search_results, "online_search_query":online_search_query })
+        return prompts.main_prompt_with_search | model, {"query":query, "search_results":search_results, "online_search_query":online_search_query }
 
-    else:
-        prompt = PromptTemplate(
-            template="""Answer the user query.\n{query}\n""",
-            input_variables=["query"],
-            partial_variables={"format_instructions": parser.get_format_instructions()},
-        )
+    return prompts.main_prompt | model, {"query":query}
 
 
-            # Create the LLMChain
-        chain = prompt | model | parser
+def invoke_main_chain(chain, inputs):
+    with timed("main_llm"):
+        message = chain.invoke(inputs)
+    with timed("parse"):
+        return prompts.response_parser.parse(message.content)
 
 
-        # Invoke the chain
-        response = chain.invoke({"query":query})
-        
-    
-    # Convert response to dictionary
-    print(chat_history[-1],"     response:", json.dumps(response, indent=4))
-    updated_json = response
+# Starts the search check and a no-search main completion side by side. Most
+# turns need no search, so the guess is usually kept and the turn costs one
+# round trip instead of two. When a search is needed the guess is dropped
+# (cancelled if it has not started yet) and the search-augmented call runs.
+def speculative_main_call(chat_history, current_json, user_input):
+    query = build_prompt_query(chat_history, current_json)
 
-        # Update the current JSON with the new answers
-    if "inferences" in updated_json and updated_json["inferences"]:
-        for update in updated_json["inferences"]:
-            if current_json[update["field_name"]] == "destination":
-                current_json[update["field_name"]] = list(set(current_json["destination"].append(update["answer"])  ))
-            else:
-                current_json[update["field_name"]] = update["answer"]
-
-
-    return unflatten_json(current_json), updated_json.get("next_reply", ""), get_options(updated_json.get("metadata", ""))
-
-
-
-
-
-def flatten_json(nested_json):
-    flat_json = {}
-
-    flat_json["optimizeType"] = nested_json.get("optimizeType", {})
-    flat_json["firstDestination"] = nested_json.get("firstDestination", {})
-    flat_json["trip_theme"] = nested_json.get("trip_theme", {})
-    flat_json["destination"] = nested_json.get("destination", [])
-    flat_json["traveller_type"] = nested_json.get("traveller_type", {})
-    flat_json["Origin_city"] = nested_json.get("Origin_city", {})
-    flat_json["budget"] = nested_json.get("budget", {})
-    flat_json["food"] = nested_json.get("food", {})
-    flat_json["trip_direction"] = nested_json.get("trip_direction", {})
-
-    time_schedule = nested_json.get("time_schedule", {})
-    onward_trip = time_schedule.get("onward_trip", {})
-    return_trip = time_schedule.get("return_trip", {})
-    duration = time_schedule.get("duration", {})
-
-    flat_json["time_schedule_onward_trip_time_hour"] = onward_trip.get("time", {}).get("hour", {})
-    flat_json["time_schedule_onward_trip_time_minute"] = onward_trip.get("time", {}).get("minute", {})
-    flat_json["time_schedule_onward_trip_date_day_of_month"] = onward_trip.get("date", {}).get("day_of_month", {})
-    flat_json["time_schedule_onward_trip_date_month"] = onward_trip.get("date", {}).get("month", {})
-    flat_json["time_schedule_onward_trip_date_year"] = onward_trip.get("date", {}).get("year", {})
-
-    flat_json["time_schedule_return_trip_time_hour"] = return_trip.get("time", {}).get("hour", {})
-    flat_json["time_schedule_return_trip_time_minute"] = return_trip.get("time", {}).get("minute", {})
-    flat_json["time_schedule_return_trip_date_day_of_month"] = return_trip.get("date", {}).get("day_of_month", {})
-    flat_json["time_schedule_return_trip_date_month"] = return_trip.get("date", {}).get("month", {})
-    flat_json["time_schedule_return_trip_date_year"] = return_trip.get("date", {}).get("year", {})
-
-    flat_json["time_schedule_duration_value"] = duration.get("value", {})
-    flat_json["time_schedule_duration_unit"] = duration.get("unit", {})
-
-    user_interests = nested_json.get("user_interests", {})
-    for key, value in user_interests.items():
-        flat_json[f"user_interest_{key}_weight"] = value.get("weight", 0)
-        flat_json[f"user_interest_{key}_user_selected"] = value.get("user_selected", False)
-        flat_json[f"user_interest_{key}_places"] = value.get("places", [])
-        flat_json[f"user_interest_{key}_user_keywords"] = value.get("user_keywords", [])
-
-    return flat_json
-
-def unflatten_json(flat_json):
-    nested_json = {}
-
-    nested_json["optimizeType"] = flat_json.get("optimizeType", {})
-    nested_json["firstDestination"] = flat_json.get("firstDestination", {})
-    nested_json["trip_theme"] = flat_json.get("trip_theme", {})
-    nested_json["destination"] = flat_json.get("destination", [])
-    nested_json["traveller_type"] = flat_json.get("traveller_type", {})
-    nested_json["Origin_city"] = flat_json.get("Origin_city", {})
-    nested_json["budget"] = flat_json.get("budget", {})
-    nested_json["food"] = flat_json.get("food", {})
-    nested_json["trip_direction"] = flat_json.get("trip_direction", {})
-
-    time_schedule = {}
-    onward_trip = {}
-    return_trip = {}
-    duration = {}
-
-    onward_trip["time"] = {
-        "hour": flat_json.get("time_schedule_onward_trip_time_hour", {}),
-        "minute": flat_json.get("time_schedule_onward_trip_time_minute", {})
-    }
-    onward_trip["date"] = {
-        "day_of_month": flat_json.get("time_schedule_onward_trip_date_day_of_month", {}),
-        "month": flat_json.get("time_schedule_onward_trip_date_month", {}),
-        "year": flat_json.get("time_schedule_onward_trip_date_year", {})
-    }
+    # Nothing to overlap when the local router already knows the answer.
+    internet = local_search_decision(user_input, current_json)
+    if internet is not None:
+        chain, inputs = main_call(query, internet)
+        return invoke_main_chain(chain, inputs), internet['internet_search_required']
 
-    return_trip["time"] = {
-        "hour": flat_json.get("time_schedule_return_trip_time_hour", {}),
-        "minute": flat_json.get("time_schedule_return_trip_time_minute", {})
-    }
-    return_trip["date"] = {
-        "day_of_month": flat_json.get("time_schedule_return_trip_date_day_of_month", {}),
-        "month": flat_json.get("time_schedule_return_trip_date_month", {}),
-        "year": flat_json.get("time_schedule_return_trip_date_year", {})
-    }
+    # Copies of the context keep both calls in this turn's trace.
+    check = backends().llm_executor.submit(contextvars.copy_context().run, check_search_needed, user_input, current_json)
+    chain, inputs = main_call(query, NO_SEARCH)
+    guess = backends().llm_executor.submit(contextvars.copy_context().run, invoke_main_chain, chain, inputs)
 
-    duration = {
-        "value": flat_json.get("time_schedule_duration_value", {}),
-        "unit": flat_json.get("time_schedule_duration_unit", {})
-    }
+    internet = check.result()
 
-    time_schedule["onward_trip"] = onward_trip
-    time_schedule["return_trip"] = return_trip
-    time_schedule["duration"] = duration
-
-    nested_json["time_schedule"] = time_schedule
-
-    user_interests = {}
-    for key in flat_json:
-        if key.startswith("user_interest_"):
-            interest_key = key.split("_")[2]  # Extracting the interest key from the flattened key
-            user_interests[interest_key] = {
-                "weight": flat_json.get(f"user_interest_{interest_key}_weight", 0),
-                "user_selected": flat_json.get(f"user_interest_{interest_key}_user_selected", False),
-                "places": flat_json.get(f"user_interest_{interest_key}_places", []),
-                "user_keywords": flat_json.get(f"user_interest_{interest_key}_user_keywords", [])
-            }
-    
-    nested_json["user_interests"] = user_interests
-
-    return nested_json
-
-
-
-def get_options(field_name):
-    options_list = {
-        "trip_theme": [
-            "romantic", "family-vacation", "eco-tourism", "party", 
-            "roadtrip", "remote-work", "business-work", "health and wellness", 
-            "spiritual", "lbgtq+", "adventure", "general-tourism-no-theme"
-        ],
-        "traveller_type": [
-            "solo", "couple", "family-no kids", "family-with kids", "friends"
-        ],
-        "budget": [
-            "on a tight budget", "comfortable spending", 
-            "happy to spend for a luxurious vacation"
-        ],
-        "food": [
-            "any", "Middle-eastern", "indian", "asian", "european", 
-            "mexican", "vegetarian", "south american", "vegan", 
-            "seafood", "fast food", "cafe", "dessert", "healthy", 
-            "bar/pub", "barbeque", "pizza"
-        ],
-        "trip_direction": [
-            "return", "oneway"
-        ],
-        "optimizeType": [
-            "manual", "auto"
-        ],
-        "time_schedule_duration_unit": [
-            "week", "month", "days"
-        ],
-        "time_schedule_onward_trip_date_year": [
-            "current_year", "next_year"
-        ],
-        "time_schedule_return_trip_date_year": [
-            "current_year", "next_year"
-        ]
-    }
-    if field_name in options_list:
-        return options_list[field_name]
-    else:
-        return []
+    if not internet['internet_search_required']:
+        counters.inc("speculation_hits")
+        return guess.result(), False
 
+    guess.cancel()
+    counters.inc("speculation_misses")
+    chain, inputs = main_call(query, internet)
+    return invoke_main_chain(chain, inputs), True
 
 
+def apply_response(current_json, response):
+    with timed("merge"):
+        return merge_response(current_json, response)
 
 
+def merge_response(current_json, response):
+    updated_json = response
 
+    # Update the current JSON with the new answers, after checking them
+    # against the field and option index
+    if "inferences" in updated_json and updated_json["inferences"]:
+        for update, reason in field_index.apply(current_json, updated_json["inferences"]):
+            logger.debug("rejected inference %s: %s", json.dumps(update), reason)
 
 
+    return current_json, updated_json.get("next_reply", ""), get_options(updated_json.get("metadata", ""))
 
 
-# Function to handle GPT calls with internet search capability
-def gpt_call_with_internet_search(chat_history: str, current_json: Dict) -> Dict:
-    # Set up the parser
-    parser = JsonOutputParser(pydantic_object=InternetSearchRequired)
-
-    # Set up the prompt template
-    prompt = PromptTemplate(
-        template="see if the user query can me answered by using gpt-4, if not then we can perform an internet search and provide gpt-4 with that internet search result realtime data , for example this can be used to answer any query if the llm needs internet data to answer it better. \n{format_instructions}\nquery: {query}.\n\n\n\n    if the search is required then give detailed online_search_query that will fetch desired response\n",
-        input_variables=["query"],
-        partial_variables={"format_instructions": parser.get_format_instructions()},
-    )
 
-    # Set up the model
-    model = ChatOpenAI(api_key=openai_api_key, temperature=0, model_name="gpt-4o-mini")
 
-    # Create the chain
-    chain = prompt | model | parser
 
-    # Create the query including chat history
-    query_with_history = f"""
-        You are a travel assistant chatbot named Travel.AI. Your task is to determine if an internet search is needed to better answer the latest question asked by the user based on the provided chat history 
+def local_search_decision(user_input, current_json):
+    if not current_app.config['LOCAL_SEARCH_ROUTER']:
+        return None
+    decision = search_router.route(user_input)
+    if decision is not None:
+        counters.inc("search_check_local")
+        decision = prefetched_search(decision, current_json)
+    return decision
 
-        Chat history:
-        {chat_history}
 
-        Your output JSON should follow this structure:
+def check_search_needed(user_input, current_json):
+    decision = local_search_decision(user_input, current_json)
+    if decision is not None:
+        return decision
 
-        {{
-            "internet_search_required": "true if needed for better answers, otherwise false",
-            "online_search_query": "specific query for an internet search if needed"
-        }}
-        see if the user query can me answered by using gpt-4, if not then we can perform an internet search and provide gpt-4 with that internet search result realtime data , for example this can be used to answer the date.
-        if the search is required then give efficient and detailed online_search_query that will fetch desired response
+    counters.inc("search_check_llm")
+    return prefetched_search(gpt_call_with_internet_search(user_input, current_json), current_json)
 
-        if the user is not saying time zone then by default take it as indian standard time
-        
 
-        if the user is asking something that is not related to travel then you dont need to preform internet search as it is not in our domain
-    """
+# With prefetch on, a search for a prefetched topic at one of the trip's
+# destinations uses the template query, which the prefetcher has warmed.
+def prefetched_search(decision, current_json):
+    if not current_app.config['PREFETCH_ENABLED'] or not decision.get('internet_search_required'):
+        return decision
+    query = decision.get('online_search_query') or ""
+    template = backends().prefetcher.template_query(query, destination_cities(current_json))
+    if template == query:
+        return decision
+    counters.inc("prefetch_queries_matched")
+    return {**decision, 'online_search_query': template}
 
-    # query_with_history = 
 
+# Function to handle GPT calls with internet search capability
+def gpt_call_with_internet_search(chat_history: str, current_json: Dict) -> Dict:
     # Perform the GPT call
-    response = chain.invoke({"query": chat_history})
+    with timed("search_check"):
+        response = search_check_chain().invoke({"query": chat_history})
 
     return response
 
 
+def search_check_chain():
+    # Set up the model
+    model = backends().llm_pool.get("gpt-4o-mini", 0, timeout=current_app.config['LLM_SEARCH_CHECK_TIMEOUT'])
+
+    # Create the chain
+    return prompts.search_check_prompt | model | prompts.search_check_parser
+
+
+
+
 
 
 
 
+app = create_app()
 
 
 if __name__ == '__main__':
+    # Exit cleanly on SIGTERM too, so the atexit hooks run
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(debug=True)
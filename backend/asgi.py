@@ -0,0 +1,205 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+
+import app as core
+from app import (
+    NO_SEARCH,
+    apply_response,
+    backends,
+    build_prompt_query,
+    cache_response,
+    cached_response,
+    load_or_create_session,
+    local_search_decision,
+    log_turn,
+    main_chain,
+    option_reply,
+    prefetched_search,
+    prefill_schedule,
+    save_turn,
+    session_response,
+    session_state,
+    turn_history,
+)
+from metrics import counters, render_prometheus, timed, trace_turn
+import prompts
+from single_flight import AsyncSingleFlight
+
+
+# Async entry point for the same routes as app.py. A turn awaits its LLM calls
+# (ainvoke on the pooled clients) and runs the blocking search in a thread, so
+# a waiting turn holds no worker thread and one process can carry many
+# sessions. Session, cache and state handling are shared with app.py; the
+# parts of it that block (session store reads and writes, the history window
+# with its token counting and summaries) run in a thread off the event loop.
+#
+#   uvicorn asgi:asgi_app --host 127.0.0.1 --port 5000
+asgi_app = cors(Quart(__name__))
+
+# The Flask app whose config and backends these routes use. The shared helpers
+# find them through flask.current_app, so each request runs in its app context.
+flask_app = core.app
+
+search_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_WORKERS", 8)))
+
+# Per-user turn queue, as turn_flights in app.py.
+turn_flights = AsyncSingleFlight()
+
+
+@asgi_app.route('/api/initialize', methods=['POST'])
+async def initialize():
+    data = await request.get_json()
+    user_id = data.get('userId', '')
+
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+
+    with flask_app.app_context():
+        user_data = await asyncio.to_thread(load_or_create_session, user_id)
+        return jsonify(session_response(user_data))
+
+
+@asgi_app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@asgi_app.route('/api/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    user_input = data.get('userInput', '')
+    user_id = data.get('userId', '')
+
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+
+    # Same per-user order and retry coalescing as /api/chat in app.py: the
+    # session is read once the turn is first in its user's queue.
+    async def turn():
+        version, user_data = await asyncio.to_thread(backends().session_store.get, user_id)
+        if user_data is None:
+            return None
+        return await arun_turn(user_id, version, user_data, user_input, data.get('stateVersion'))
+
+    try:
+        with flask_app.app_context():
+            reply = await turn_flights.run(user_id, user_input, turn)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if reply is None:
+        return jsonify({'error': 'Session not found, call /api/initialize first'}), 404
+    return jsonify(reply)
+
+
+async def arun_turn(user_id, version, user_data, user_input, client_version=None):
+    with trace_turn() as trace:
+        status = "ok"
+        try:
+            with timed("turn"):
+                with timed("flatten"):
+                    flat_json = session_state(user_data).flat()
+
+                response = option_reply(user_data, flat_json, user_input)
+                if response is not None:
+                    current_json, next_reply, options = apply_response(flat_json, response)
+                else:
+                    prefill_schedule(flat_json, user_input)
+                    history = await asyncio.to_thread(turn_history, user_id, user_data, user_input)
+                    current_json, next_reply, options = await acall_openai_api(history, flat_json, user_input)
+
+                state = await asyncio.to_thread(
+                    save_turn, user_id, version, user_data, user_input, current_json, next_reply, options, client_version
+                )
+
+            return {
+                **state,
+                "next_reply": next_reply,
+                "options": options
+            }
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            log_turn(user_id, trace, status)
+
+
+async def acall_openai_api(chat_history, current_json, user_input):
+    key, response = cached_response(chat_history, current_json, user_input)
+    if response is not None:
+        return apply_response(current_json, response)
+
+    query = build_prompt_query(chat_history, current_json)
+    if flask_app.config['SPECULATIVE_MAIN_CALL']:
+        response, searched = await aspeculative_main_call(query, current_json, user_input)
+    else:
+        internet = await acheck_search_needed(user_input, current_json)
+        chain, inputs = await amain_call(query, internet)
+        response = await ainvoke_main_chain(chain, inputs)
+        searched = "search_results" in inputs
+
+    cache_response(key, response, searched)
+
+    return apply_response(current_json, response)
+
+
+async def acheck_search_needed(user_input, current_json):
+    decision = local_search_decision(user_input, current_json)
+    if decision is not None:
+        return decision
+
+    counters.inc("search_check_llm")
+    with timed("search_check"):
+        decision = await core.search_check_chain().ainvoke({"query": user_input})
+    return prefetched_search(decision, current_json)
+
+
+async def amain_call(query, internet):
+    search_results = None
+    if internet['internet_search_required']:
+        loop = asyncio.get_running_loop()
+        with timed("search"):
+            search_results = await loop.run_in_executor(search_executor, backends().search.run, internet['online_search_query'])
+
+    return main_chain(query, internet, search_results)
+
+
+async def ainvoke_main_chain(chain, inputs):
+    with timed("main_llm"):
+        message = await chain.ainvoke(inputs)
+    with timed("parse"):
+        return prompts.response_parser.parse(message.content)
+
+
+# Same idea as speculative_main_call in app.py, except that a wasted guess is
+# really cancelled here: the task is cancelled and its request aborted.
+async def aspeculative_main_call(query, current_json, user_input):
+    internet = local_search_decision(user_input, current_json)
+    if internet is not None:
+        chain, inputs = await amain_call(query, internet)
+        return await ainvoke_main_chain(chain, inputs), internet['internet_search_required']
+
+    chain, inputs = main_chain(query, NO_SEARCH)
+    guess = asyncio.ensure_future(ainvoke_main_chain(chain, inputs))
+    try:
+        internet = await acheck_search_needed(user_input, current_json)
+    except Exception:
+        guess.cancel()
+        raise
+
+    if not internet['internet_search_required']:
+        counters.inc("speculation_hits")
+        return await guess, False
+
+    guess.cancel()
+    counters.inc("speculation_misses")
+    chain, inputs = await amain_call(query, internet)
+    return await ainvoke_main_chain(chain, inputs), True
+
+
+if __name__ == '__main__':
+    asgi_app.run(debug=True)
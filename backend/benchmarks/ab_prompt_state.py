@@ -0,0 +1,43 @@
+# A/B of the prompt state encodings: replays the scripted conversation once per
+# PROMPT_STATE_MODE against the fake LLM and compares main-prompt tokens.
+#
+#   cd backend && python -m benchmarks.ab_prompt_state
+import contextlib
+import os
+
+import app
+from benchmarks.fakes import CONVERSATION, FakeLLMPool, FakeSearch, install
+from prompt_state import PROMPT_STATE_MODES
+
+
+def run_mode(mode):
+    pool = FakeLLMPool()
+    install(app, pool, FakeSearch())
+    app.app.config['PROMPT_STATE_MODE'] = mode
+    client = app.app.test_client()
+    user_id = f"ab-{mode}"
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        client.post("/api/initialize", json={"userId": user_id})
+        for user_input, _, _ in CONVERSATION:
+            response = client.post("/api/chat", json={"userId": user_id, "userInput": user_input})
+            assert response.status_code == 200, response.json
+
+    return pool.prompt_tokens["gpt-4o"], app.session_state(app.app.extensions['travel_planner'].session_store.get(user_id)[1]).nested()
+
+
+def main():
+    results = {mode: run_mode(mode) for mode in PROMPT_STATE_MODES}
+    baseline_tokens, baseline_state = results["full"]
+
+    print(f"{'mode':<11} {'tokens/turn':>12} {'total':>8} {'vs full':>8} {'same state':>11}")
+    for mode, (tokens, state) in results.items():
+        total = sum(tokens)
+        print(
+            f"{mode:<11} {total / len(tokens):>12.0f} {total:>8} "
+            f"{(total - sum(baseline_tokens)) / sum(baseline_tokens):>+8.1%} {str(state == baseline_state):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
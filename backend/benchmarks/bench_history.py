@@ -0,0 +1,60 @@
+# Prompt tokens per turn: the whole history as a repr of message dicts (old
+# chat()) vs. the HistoryManager window with a running summary.
+#
+#   cd backend && python -m benchmarks.bench_history
+import json
+
+from app import flatten_json, initialJson, initial_message
+from history import HistoryManager, count_tokens
+from session_store import MemorySessionStore
+from prompts import QUERY_TEMPLATE, build_query
+from fields import details
+
+
+class InlineExecutor:
+    # Runs "background" summaries immediately so the numbers are reproducible.
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def fake_summarize(summary, lines):
+    # Stand-in for gpt-4o-mini: roughly the 80-word cap the prompt asks for.
+    words = (summary + " " + " ".join(lines)).split()
+    return " ".join(words[-80:])
+
+
+def legacy_prompt(chat_history, current_json):
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for line in chat_history:
+        role, content = line.split(": ", 1)
+        messages.append({"role": "user" if role == "User" else "assistant", "content": content})
+    return QUERY_TEMPLATE.format(
+        details=json.dumps(details, indent=4),
+        chat_history=messages,
+        current_json=json.dumps(current_json, indent=4),
+    )
+
+
+def main(turns=40):
+    store = MemorySessionStore()
+    manager = HistoryManager(fake_summarize, store, InlineExecutor())
+    current_json = flatten_json(initialJson)
+    chat_history = list(initial_message)
+
+    print(f"{'turn':>4} {'legacy tokens':>14} {'managed tokens':>15}")
+    for turn in range(1, turns + 1):
+        chat_history.append(f"User: message number {turn}, with a few words about Paris, Rome and the budget")
+        user_data = store.update("bench", lambda data: {**(data or {}), "chat_history": list(chat_history)})
+
+        legacy = count_tokens(legacy_prompt(chat_history, current_json))
+        window = manager.window("bench", user_data)
+        managed = count_tokens(build_query(window, json.dumps(current_json, indent=4)))
+        if turn == 1 or turn % 5 == 0:
+            print(f"{turn:>4} {legacy:>14} {managed:>15}")
+        chat_history.append(
+            f"Bot: reply number {turn}. Thanks, that helps! Could you tell me a little more about your trip dates?"
+        )
+
+
+if __name__ == "__main__":
+    main()
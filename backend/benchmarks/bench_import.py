@@ -0,0 +1,79 @@
+# Cold import of app.py, measured with `python -X importtime` in fresh
+# processes (median of --runs), plus the slowest of its direct imports. Exits
+# non-zero when the import goes over --budget-ms, or when one of the heavy
+# packages the app only needs on the first turn (langchain, openai, ...) is
+# imported eagerly again, so it can gate CI.
+#
+#   cd backend && python -m benchmarks.bench_import [--budget-ms 300] [--runs 5]
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Imported on first use (a turn, a search), never by `import app`.
+LAZY_PACKAGES = ("langchain", "langchain_core", "langchain_community", "langchain_openai", "openai", "pydantic", "tiktoken")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module):
+    # (cumulative us, [(cumulative us, name) of its direct imports])
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND, capture_output=True, text=True, check=True,
+    ).stderr
+    children = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)) // 2, match.group(4)
+        if depth == 1:
+            children.append((cumulative, name))
+        elif depth == 0:
+            if name == module:
+                return cumulative, children
+            children = []
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def eager_packages(module):
+    output = subprocess.run(
+        [sys.executable, "-c", f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"],
+        cwd=BACKEND, capture_output=True, text=True, check=True,
+    ).stdout
+    loaded = json.loads(output.strip().splitlines()[-1])
+    return sorted({name.split(".")[0] for name in loaded} & set(LAZY_PACKAGES))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=300)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [import_time(args.module) for _ in range(args.runs)]
+    median_ms = statistics.median(total for total, _ in runs) / 1000
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print("slowest direct imports (last run):")
+    for cumulative, name in sorted(runs[-1][1], reverse=True)[:8]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"import took {median_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    eager = eager_packages(args.module)
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
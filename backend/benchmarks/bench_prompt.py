@@ -0,0 +1,77 @@
+# Per-turn prompt assembly: rebuilding everything (old call_openai_api) vs the
+# pre-rendered segments in prompts.py. Also checks that importing the app
+# leaves langchain unloaded and times the first-use build of the prompt
+# objects, so langchain is only imported here where the legacy turn needs it.
+#
+#   cd backend && python -m benchmarks.bench_prompt
+import copy
+import json
+import sys
+import time
+import timeit
+import tracemalloc
+
+from app import flatten_json, initialJson, initial_message
+from fields import details
+import prompts
+
+
+def legacy_turn(chat_history, current_json):
+    # What every turn used to do: a fresh details dict, json.dumps of it, the
+    # whole f-string, a parser and a prompt template.
+    from langchain.prompts import PromptTemplate
+    from langchain_core.output_parsers import JsonOutputParser
+
+    fresh_details = copy.deepcopy(details)
+    parser = JsonOutputParser(pydantic_object=prompts.ResponseStructure)
+    query = prompts.QUERY_TEMPLATE.format(
+        details=json.dumps(fresh_details, indent=4),
+        chat_history="\n".join(chat_history),
+        current_json=json.dumps(current_json, indent=4),
+    )
+    PromptTemplate(
+        template="""Answer the user query.\n{query}\n""",
+        input_variables=["query"],
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
+    return query
+
+
+def registry_turn(chat_history, current_json):
+    return prompts.build_query(chat_history, json.dumps(current_json, indent=4))
+
+
+def first_use_ms():
+    # The langchain imports and prompt objects a process pays for on its first turn.
+    assert "langchain_core" not in sys.modules, "importing app loaded langchain"
+    start = time.perf_counter()
+    prompts.main_prompt
+    return (time.perf_counter() - start) * 1e3
+
+
+def measure(fn, chat_history, current_json, number):
+    seconds = timeit.timeit(lambda: fn(chat_history, current_json), number=number)
+    tracemalloc.start()
+    fn(chat_history, current_json)
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    return seconds / number * 1e6, peak, blocks
+
+
+def main(number=2000):
+    chat_history = initial_message + ["User: hi", "Bot: Where would you like to go?", "User: Paris, Rome"]
+    current_json = flatten_json(initialJson)
+    print(f"import app: langchain not loaded; first-use build of the prompt objects {first_use_ms():.0f} ms")
+
+    assert legacy_turn(chat_history, current_json) == registry_turn(chat_history, current_json)
+
+    print(f"{'variant':<10} {'us/turn':>10} {'peak bytes':>12} {'live blocks':>12}")
+    for name, fn in (("legacy", legacy_turn), ("registry", registry_turn)):
+        us, peak, blocks = measure(fn, chat_history, current_json, number)
+        print(f"{name:<10} {us:>10.1f} {peak:>12} {blocks:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Accuracy of the local search router on a labelled corpus, and the share of
+# gpt-4o-mini classifier calls it avoids.
+#
+#   cd backend && python -m benchmarks.bench_router
+import json
+import os
+import timeit
+
+from router import SearchRouter
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "search_router.jsonl")
+
+
+def load_corpus(path=FIXTURES):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    corpus = load_corpus()
+    router = SearchRouter()
+
+    decided = correct = 0
+    for row in corpus:
+        decision = router.route(row["input"])
+        if decision is None:
+            continue
+        decided += 1
+        if decision["internet_search_required"] == row["search"]:
+            correct += 1
+        else:
+            print(f"wrong: {row['input']!r} -> {decision['internet_search_required']}")
+
+    seconds = timeit.timeit(lambda: [router.route(row["input"]) for row in corpus], number=200)
+    print(f"turns:            {len(corpus)}")
+    print(f"decided locally:  {decided} ({decided / len(corpus):.0%} of classifier calls avoided)")
+    print(f"local accuracy:   {correct / decided if decided else 0:.1%}")
+    print(f"route() cost:     {seconds / (200 * len(corpus)) * 1e6:.1f} us/turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Accuracy of the local date/time/duration extractor on a labelled corpus
+# (including inputs it must leave alone: questions, per-stop durations, fields
+# already answered), and what prefilling its fields changes end to end: the
+# scripted conversation against the fake LLM with the extractor off and on.
+#
+#   cd backend && python -m benchmarks.bench_schedule
+import datetime
+import json
+import os
+import re
+import timeit
+
+from benchmarks.fakes import CONVERSATION, FakeLLMPool, FakeSearch, install
+from history import count_tokens
+from schedule import extract_schedule
+from state import is_default, state_schema
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "schedule.jsonl")
+TODAY = datetime.date(2026, 1, 15)  # the corpus' years are relative to this
+
+
+def load_corpus(path=FIXTURES):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def state(row):
+    # The flat state a turn really has: every field, defaults where unanswered.
+    return {**state_schema.blank(), **row.get("state", {})}
+
+
+_STATE = re.compile(r"Questions that need to be answered[^\n]*\n\s*(\{.*?\})\n\s*your output json", re.DOTALL)
+
+
+# The scripted fake, except that like a real model it leaves out inferences
+# the state in the prompt already shows (a prefilled field it agrees with).
+class ConfirmingLLMPool(FakeLLMPool):
+    def __init__(self):
+        super().__init__()
+        self.completion_tokens = []
+
+    def _message(self, model, prompt):
+        message = super()._message(model, prompt)
+        if model != "gpt-4o":
+            return message
+        state = json.loads(_STATE.search(prompt).group(1))
+        response = json.loads(message.content)
+        response["inferences"] = [
+            update for update in response["inferences"] if state.get(update["field_name"]) != update["answer"]
+        ]
+        message.content = json.dumps(response)
+        self.completion_tokens.append(count_tokens(message.content))
+        return message
+
+
+def end_to_end(enabled):
+    import app
+
+    pool = ConfirmingLLMPool()
+    install(app, pool, FakeSearch())
+    app.app.config['SCHEDULE_EXTRACTOR'] = enabled
+    app.app.config['PROMPT_STATE_MODE'] = "compact"
+    app.app.config['OPTION_FAST_PATH'] = False  # every turn reaches the model
+    client = app.app.test_client()
+    user_id = f"schedule-{enabled}"
+    store = app.app.extensions['travel_planner'].session_store
+    schedule_keys = [key for key in state_schema.defaults if key.startswith("time_schedule_")]
+
+    client.post("/api/initialize", json={"userId": user_id})
+    done_at = None
+    for turn, (user_input, _, _) in enumerate(CONVERSATION, 1):
+        response = client.post("/api/chat", json={"userId": user_id, "userInput": user_input})
+        assert response.status_code == 200, response.json
+        flat = app.session_state(store.get(user_id)[1]).flat()
+        if done_at is None and not any(is_default(flat[key], state_schema.defaults[key]) for key in schedule_keys):
+            done_at = turn
+
+    prompt = pool.prompt_tokens["gpt-4o"]
+    return sum(prompt), sum(pool.completion_tokens), len(prompt), done_at, flat
+
+
+def main():
+    corpus = load_corpus()
+    states = [state(row) for row in corpus]
+    exact = wrong_fields = missed_fields = extracted_fields = 0
+    schedule_turns = fully_hinted = 0
+
+    for row, flat in zip(corpus, states):
+        expected = row["expected"]
+        found = extract_schedule(row["input"], flat, today=TODAY)
+        exact += found == expected
+        wrong = {key for key, value in found.items() if expected.get(key) != value}
+        missed = set(expected) - set(found)
+        wrong_fields += len(wrong)
+        missed_fields += len(missed)
+        extracted_fields += len(found) - len(wrong)
+        if expected:
+            schedule_turns += 1
+            fully_hinted += not wrong and not missed
+        if wrong or missed:
+            print(f"mismatch: {row['input']!r}\n  got      {found}\n  expected {expected}")
+
+    seconds = timeit.timeit(lambda: [extract_schedule(row["input"], flat, TODAY) for row, flat in zip(corpus, states)], number=200)
+    print(f"rows:                   {len(corpus)} ({schedule_turns} with scheduling info)")
+    print(f"exact rows:             {exact / len(corpus):.1%}")
+    print(f"fields extracted:       {extracted_fields} correct, {wrong_fields} wrong, {missed_fields} missed")
+    print(f"turns fully prefilled:  {fully_hinted} of {schedule_turns}")
+    print(f"extract cost:           {seconds / (200 * len(corpus)) * 1e6:.1f} us/turn")
+
+    print("\nend to end, scripted conversation against the fake LLM")
+    print(f"{'extractor':<10} {'prompt tok':>11} {'completion tok':>15} {'model calls':>12} {'schedule done at':>17} {'same state':>11}")
+    results = {enabled: end_to_end(enabled) for enabled in (False, True)}
+    for enabled, (prompt, completion, calls, done_at, final) in results.items():
+        print(
+            f"{'on' if enabled else 'off':<10} {prompt:>11} {completion:>15} {calls:>12} "
+            f"{'turn ' + str(done_at) if done_at else 'never':>17} {str(final == results[False][4]):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
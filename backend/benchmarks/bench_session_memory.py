@@ -0,0 +1,107 @@
+# Memory held by 50k realistic sessions: MemorySessionStore (everything as
+# JSON text) vs BoundedSessionStore under an accounted byte budget, plus read
+# latency per tier. The budget bounds the bytes the store counts, not the RSS. Each store runs in its own process so RSS is comparable.
+#
+#   cd backend && python -m benchmarks.bench_session_memory [--sessions 50000] [--budget-mb 32]
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import CONVERSATION
+from benchmarks.load_test import percentile, rss_bytes
+from session_store import BoundedSessionStore, MemorySessionStore
+from state import state_schema
+
+
+def session(n, rng):
+    # A mid-conversation session: some answers, 6-20 lines of history.
+    flat = state_schema.blank()
+    lines = ["Bot: Hello! I am here to help you plan your vacation. Let's get started!"]
+    for user_input, inferences, _ in CONVERSATION[: rng.randint(3, 10)]:
+        for update in inferences:
+            flat[update["field_name"]] = update["answer"]
+        lines += [f"User: {user_input}", f"Bot: Thanks! Noted, session {n}. Could you tell me more about your trip?"]
+    return {"chat_history": lines, "state": state_schema.sparse(flat).dump(), "options": [], "state_version": len(lines)}
+
+
+def run(kind, sessions, budget_mb):
+    rng = random.Random(0)
+    documents = [session(n, rng) for n in range(64)]
+    baseline = rss_bytes()
+
+    if kind == "memory":
+        store = MemorySessionStore()
+    else:
+        store = BoundedSessionStore(
+            max_bytes=budget_mb * 2 ** 20, hot_bytes=budget_mb * 2 ** 20 // 4, idle_seconds=60, spill_dir=tempfile.mkdtemp(),
+        )
+
+    start = time.perf_counter()
+    for n in range(sessions):
+        store.compare_and_set(f"user-{n}", 0, documents[n % len(documents)])
+    write_us = (time.perf_counter() - start) / sessions * 1e6
+
+    # Reads of the most recent (hot), middle (warm) and oldest (cold) sessions.
+    reads = {}
+    for tier, users in (("recent", range(sessions - 200, sessions)), ("middle", range(sessions // 2, sessions // 2 + 200)), ("oldest", range(200))):
+        latencies = []
+        for n in users:
+            start = time.perf_counter()
+            store.get(f"user-{n}")
+            latencies.append(time.perf_counter() - start)
+        reads[tier] = round(percentile(latencies, 0.5) * 1e6, 1)
+
+    result = {
+        "store": kind,
+        "sessions": sessions,
+        "rss_mb": round((rss_bytes() - baseline) / 2 ** 20, 1),
+        "write_us": round(write_us, 1),
+        "read_p50_us": reads,
+        "lost": sum(store.get(f"user-{n}")[1] is None for n in range(0, sessions, 97)),
+    }
+    if kind == "bounded":
+        result["stats"] = store.stats()
+        store.close()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--budget-mb", type=int, default=32)
+    parser.add_argument("--store", choices=("memory", "bounded"))
+    args = parser.parse_args()
+
+    if args.store:
+        run(args.store, args.sessions, args.budget_mb)
+        return
+
+    sample = json.dumps(session(0, random.Random(0)))
+    print(f"{args.sessions} sessions, ~{len(sample) / 1024:.1f} KiB of JSON each, budget {args.budget_mb} MiB")
+    for kind in ("memory", "bounded"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_session_memory", "--store", kind,
+             "--sessions", str(args.sessions), "--budget-mb", str(args.budget_mb)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"\n{kind}: +{result['rss_mb']} MiB RSS, write {result['write_us']} us, "
+              f"read p50 us {result['read_p50_us']}, lost {result['lost']}")
+        if "stats" in result:
+            stats = result["stats"]
+            print("  " + json.dumps(stats))
+            # resident_bytes is what the budget counts; the rest of the RSS
+            # growth is allocator slack (freed blocks the process keeps) and
+            # the interpreter's own caches, which no budget here covers.
+            print(f"  accounted budget {args.budget_mb} MiB (not an RSS ceiling):"
+                  f" accounted {stats['resident_bytes'] / 2 ** 20:.1f} MiB"
+                  f" (bookkeeping {stats['index_bytes'] / 2 ** 20:.1f} MiB),"
+                  f" unaccounted {result['rss_mb'] - stats['resident_bytes'] / 2 ** 20:.1f} MiB of RSS growth")
+
+
+if __name__ == "__main__":
+    main()
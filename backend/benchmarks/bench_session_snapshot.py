@@ -0,0 +1,117 @@
+# Snapshots of an in-process store: the cost a write pays for being tracked,
+# the background flush per session, and a restart (a new process) against
+# files holding 1k-100k saved sessions. Startup should stay flat; the first
+# read of each session pays for its hydration.
+#
+#   cd backend && python -m benchmarks.bench_session_snapshot [--sessions 1000 10000 100000]
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_session_memory import session
+from benchmarks.load_test import percentile
+from session_store import MemorySessionStore, SnapshotSessionStore
+
+
+def documents():
+    rng = random.Random(0)
+    return [session(n, rng) for n in range(64)]
+
+
+def write_overhead(docs, writes=20000):
+    # Per-write cost of the memory store alone vs. wrapped; flushes excluded.
+    results = {}
+    for name in ("memory", "snapshot"):
+        path = os.path.join(tempfile.mkdtemp(), "sessions.snapshot.db")
+        store = MemorySessionStore() if name == "memory" else SnapshotSessionStore(MemorySessionStore(), path, interval=3600)
+        versions = {}
+        start = time.perf_counter()
+        for n in range(writes):
+            user_id = f"user-{n % 1000}"
+            version = versions.get(user_id, 0)
+            store.compare_and_set(user_id, version, docs[n % len(docs)])
+            versions[user_id] = version + 1
+        results[name] = (time.perf_counter() - start) / writes * 1e6
+    return results
+
+
+def save(docs, sessions):
+    # Fills a snapshot file, closing the store as a clean shutdown would.
+    path = os.path.join(tempfile.mkdtemp(), "sessions.snapshot.db")
+    store = SnapshotSessionStore(MemorySessionStore(), path, interval=3600)
+    for n in range(sessions):
+        store.compare_and_set(f"user-{n}", 0, docs[n % len(docs)])
+    start = time.perf_counter()
+    store.flush()
+    flush_us = (time.perf_counter() - start) / sessions * 1e6
+    store.close()
+    file_mb = sum(os.path.getsize(name) for name in (path, path + "-wal") if os.path.exists(name)) / 2 ** 20
+    return path, flush_us, file_mb
+
+
+def restore(path, sessions, reads=2000):
+    # Runs in a fresh process: startup, then first and second reads.
+    docs = documents()
+    start = time.perf_counter()
+    store = SnapshotSessionStore(MemorySessionStore(), path, interval=3600)
+    startup_ms = (time.perf_counter() - start) * 1e3
+
+    first, again = [], []
+    for n in random.Random(0).sample(range(sessions), min(reads, sessions)):
+        start = time.perf_counter()
+        version, data = store.get(f"user-{n}")
+        first.append(time.perf_counter() - start)
+        assert data == docs[n % len(docs)], n
+        start = time.perf_counter()
+        store.get(f"user-{n}")
+        again.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    assert store.get("never-seen") == (0, None)
+    miss_us = (time.perf_counter() - start) * 1e6
+    print(json.dumps({
+        "startup_ms": startup_ms,
+        "hydrate_p50_us": percentile(first, 0.5) * 1e6,
+        "hydrate_p99_us": percentile(first, 0.99) * 1e6,
+        "read_p50_us": percentile(again, 0.5) * 1e6,
+        "miss_us": miss_us,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--restore")
+    args = parser.parse_args()
+
+    if args.restore:
+        restore(args.restore, args.sessions[0])
+        return
+
+    docs = documents()
+    overhead = write_overhead(docs)
+    print(
+        f"write: memory {overhead['memory']:.1f} us, with snapshots {overhead['snapshot']:.1f} us"
+        f" (+{overhead['snapshot'] - overhead['memory']:.1f} us per turn)"
+    )
+
+    print(f"{'sessions':>9} {'flush us':>9} {'file MB':>8} {'startup ms':>11} {'hydrate p50':>12} {'p99':>8} {'read p50':>9} {'miss us':>8}")
+    for sessions in args.sessions:
+        path, flush_us, file_mb = save(docs, sessions)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_session_snapshot", "--restore", path, "--sessions", str(sessions)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{sessions:>9} {flush_us:>9.1f} {file_mb:>8.1f} {r['startup_ms']:>11.2f}"
+            f" {r['hydrate_p50_us']:>12.1f} {r['hydrate_p99_us']:>8.1f} {r['read_p50_us']:>9.1f} {r['miss_us']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
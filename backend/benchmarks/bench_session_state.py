@@ -0,0 +1,106 @@
+# Session state stored as the whole nested document (before) vs the sparse
+# [[key, value], ...] list (after): stored size and (de)serialization time for
+# pickle (SimpleCache) and JSON (the session stores), and the state work of
+# one request: load -> flat view for the turn -> stored form again. Also
+# checks the sparse patches and round trips against the nested functions.
+#
+#   cd backend && python -m benchmarks.bench_session_state
+import json
+import pickle
+import random
+import timeit
+
+from benchmarks.bench_state import random_state
+from benchmarks.fakes import CONVERSATION
+from state import flatten_json, state_schema, unflatten_json
+from state_patch import escape
+
+
+# Minimal RFC 6902 diff of two nested documents, the reference for
+# state_schema.patch(): dicts are diffed key by key, anything else (lists
+# included) is replaced whole when it differs.
+def make_patch(src, dst, path=""):
+    ops = []
+    for key in src:
+        if key not in dst:
+            ops.append({"op": "remove", "path": f"{path}/{escape(key)}"})
+    for key, value in dst.items():
+        pointer = f"{path}/{escape(key)}"
+        if key not in src:
+            ops.append({"op": "add", "path": pointer, "value": value})
+        elif isinstance(value, dict) and isinstance(src[key], dict) and value and src[key]:
+            ops.extend(make_patch(src[key], value, pointer))
+        elif src[key] != value or type(src[key]) is not type(value):
+            ops.append({"op": "replace", "path": pointer, "value": value})
+    return ops
+
+
+def check(samples=2000, seed=0):
+    rng = random.Random(seed)
+    for _ in range(samples):
+        nested_a, flat_a = random_state(rng)
+        nested_b, flat_b = random_state(rng)
+        a, b = state_schema.sparse(flat_a), state_schema.sparse(flat_b)
+        loaded = state_schema.load(json.loads(json.dumps(a.dump())))
+        assert loaded.flat() == flatten_json(nested_a)
+        assert loaded.nested() == nested_a
+        assert state_schema.patch(a, b) == make_patch(nested_a, nested_b)
+    print(f"sparse state ok ({samples} random pairs)")
+
+
+def sessions(count, seed=1):
+    # Mid-conversation sessions: the answers of the first 3-10 scripted turns.
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        flat = state_schema.blank()
+        for _, inferences, _ in CONVERSATION[: rng.randint(3, 10)]:
+            for update in inferences:
+                flat[update["field_name"]] = update["answer"]
+        result.append(flat)
+    return result
+
+
+def nested_session(flat):
+    return {"chat_history": [], "current_json": unflatten_json(flat), "options": [], "state_version": 3}
+
+
+def sparse_session(flat):
+    return {"chat_history": [], "state": state_schema.sparse(flat).dump(), "options": [], "state_version": 3}
+
+
+def nested_request(payload):
+    flat = flatten_json(json.loads(payload)["current_json"])
+    return json.dumps({"chat_history": [], "current_json": unflatten_json(flat), "options": [], "state_version": 4})
+
+
+def sparse_request(payload):
+    flat = state_schema.load(json.loads(payload)["state"]).flat()
+    return json.dumps({"chat_history": [], "state": state_schema.sparse(flat).dump(), "options": [], "state_version": 4})
+
+
+def measure(fn, items, number):
+    return timeit.timeit(lambda: [fn(item) for item in items], number=number) / number / len(items) * 1e6
+
+
+def main(number=200):
+    check()
+
+    flats = sessions(50)
+    print("state only (chat history left out); sizes in bytes, times in us per session")
+    print(f"{'layout':<7} {'pickle B':>9} {'pickle us':>10} {'json B':>7} {'json us':>8} {'request us':>11}")
+    for name, build, request in (("nested", nested_session, nested_request), ("sparse", sparse_session, sparse_request)):
+        documents = [build(flat) for flat in flats]
+        pickled = [pickle.dumps(document, pickle.HIGHEST_PROTOCOL) for document in documents]
+        encoded = [json.dumps(document) for document in documents]
+        pickle_us = measure(lambda document: pickle.loads(pickle.dumps(document, pickle.HIGHEST_PROTOCOL)), documents, number)
+        json_us = measure(lambda document: json.loads(json.dumps(document)), documents, number)
+        request_us = measure(request, encoded, number)
+        print(
+            f"{name:<7} {sum(map(len, pickled)) / len(pickled):>9.0f} {pickle_us:>10.1f}"
+            f" {sum(map(len, encoded)) / len(encoded):>7.0f} {json_us:>8.1f} {request_us:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# flatten/unflatten: the old hand-written functions vs. the compiled
+# StateSchema, plus a randomized round-trip check of the new ones.
+#
+#   cd backend && python -m benchmarks.bench_state
+import copy
+import random
+import timeit
+
+from benchmarks import legacy_state
+from state import flatten_json, initialJson, state_schema, unflatten_json
+
+
+def random_value(default, rng):
+    if isinstance(default, bool):
+        return rng.random() < 0.5
+    if isinstance(default, (int, float)):
+        return round(rng.random(), 1)
+    if isinstance(default, list):
+        return [rng.choice(["Paris", "Rome", "Kyoto", "Louvre", "beach_club"]) for _ in range(rng.randint(0, 3))]
+    return rng.choice([{}, "comfortable spending", "auto", 10, 0, "Middle-eastern", "new_york"])
+
+
+def random_state(rng):
+    flat = {key: random_value(default, rng) for key, default in state_schema.defaults.items()}
+    return unflatten_json(flat), flat
+
+
+def check_round_trip(samples=2000, seed=0):
+    rng = random.Random(seed)
+    for _ in range(samples):
+        nested, flat = random_state(rng)
+        assert flatten_json(nested) == flat
+        assert unflatten_json(flatten_json(nested)) == nested
+        assert flatten_json(copy.deepcopy(nested)) == flat
+    # Partial documents fall back to template defaults.
+    assert flatten_json({}) == flatten_json(initialJson)
+    # Interest names with underscores survive, unlike key.split("_")[2].
+    schema = type(state_schema)({"user_interests": {"water_sports": {"weight": 0, "places": []}}})
+    nested = {"user_interests": {"water_sports": {"weight": 0.5, "places": ["Bali"]}}}
+    assert schema.unflatten(schema.flatten(nested)) == nested
+    print(f"round trip ok ({samples} random states)")
+
+
+def main(number=5000):
+    check_round_trip()
+
+    nested, flat = random_state(random.Random(1))
+    cases = (
+        ("flatten", legacy_state.flatten_json, flatten_json, nested),
+        ("unflatten", legacy_state.unflatten_json, unflatten_json, flat),
+    )
+    print(f"{'function':<10} {'legacy us':>10} {'schema us':>10}")
+    for name, legacy, compiled, arg in cases:
+        old = timeit.timeit(lambda: legacy(arg), number=number) / number * 1e6
+        new = timeit.timeit(lambda: compiled(arg), number=number) / number * 1e6
+        print(f"{name:<10} {old:>10.1f} {new:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
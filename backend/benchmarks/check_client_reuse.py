@@ -0,0 +1,73 @@
+# Drives several "turns" (classifier + main call) through LLMClientPool against
+# a local stub of the chat completions API and counts TCP connections.
+#
+#   cd backend && python -m benchmarks.check_client_reuse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_clients import LLMClientPool
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = set()
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        model = json.loads(body).get("model", "")
+        with self.lock:
+            StubHandler.connections.add(self.client_address)
+            StubHandler.requests += 1
+        payload = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "{}"},
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def turn(pool):
+    pool.get("gpt-4o-mini", 0, timeout=5).invoke("search needed?")
+    pool.get("gpt-4o", 1, timeout=5).invoke("next reply")
+
+
+def main(turns=50, workers=4):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pool = LLMClientPool(
+        "sk-stub",
+        pool_size=workers,
+        base_url=f"http://127.0.0.1:{server.server_port}/v1",
+    )
+    try:
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(lambda _: turn(pool), range(turns)))
+    finally:
+        pool.close()
+        server.shutdown()
+
+    print(f"requests={StubHandler.requests} connections={len(StubHandler.connections)}")
+    assert StubHandler.requests == 2 * turns
+    assert len(StubHandler.connections) <= workers, "connections were not reused"
+
+
+if __name__ == "__main__":
+    main()
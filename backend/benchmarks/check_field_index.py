@@ -0,0 +1,72 @@
+# Behaviour of FieldIndex.apply() on model inferences: field names and options
+# resolved in any case or spelling, out-of-range and unknown values rejected,
+# destination lists merged without duplicates in any script, and the first
+# destination kept in the list.
+#
+#   cd backend && python -m benchmarks.check_field_index
+from field_index import FieldIndex, canon, merge_unique
+from state import state_schema
+
+
+def blank():
+    return dict(state_schema.defaults)
+
+
+def check_options():
+    index = FieldIndex()
+    flat = blank()
+    rejected = index.apply(flat, [
+        {"field_name": "Traveller_Type", "answer": "Family with Kids"},
+        {"field_name": "food", "answer": "BBQ"},
+        {"field_name": "budget", "answer": "moderate"},
+    ])
+    assert flat["traveller_type"] == "family-with kids"
+    assert flat["food"] == "barbeque"
+    assert [update["answer"] for update, _ in rejected] == ["moderate"]
+    print("options ok")
+
+
+def check_ranges():
+    index = FieldIndex()
+    flat = blank()
+    rejected = index.apply(flat, [
+        {"field_name": "time_schedule_onward_trip_time_hour", "answer": "14"},
+        {"field_name": "time_schedule_onward_trip_date_month", "answer": 13},
+        {"field_name": "no_such_field", "answer": "x"},
+    ])
+    assert flat["time_schedule_onward_trip_time_hour"] == 14
+    assert len(rejected) == 2
+    print("ranges ok")
+
+
+def check_destinations():
+    index = FieldIndex()
+    flat = blank()
+    index.apply(flat, [{"field_name": "destination", "answer": ["Paris", "Rome"]}])
+    index.apply(flat, [{"field_name": "destination", "answer": "rome"}])
+    assert flat["destination"] == ["Paris", "Rome"]
+
+    # Names in other scripts are told apart, not reduced to "".
+    flat = blank()
+    index.apply(flat, [{"field_name": "destination", "answer": ["東京", "大阪", "Москва"]}])
+    assert flat["destination"] == ["東京", "大阪", "Москва"]
+    index.apply(flat, [{"field_name": "destination", "answer": "москва"}])
+    assert flat["destination"] == ["東京", "大阪", "Москва"]
+    assert canon("Köln") != canon("Kln") and canon("KÖLN") == canon("köln")
+    assert merge_unique(["München"], ["Munchen", "MÜNCHEN"]) == ["München", "Munchen"]
+
+    index.apply(flat, [{"field_name": "firstDestination", "answer": "大阪"}])
+    assert flat["destination"] == ["東京", "大阪", "Москва"]
+    index.apply(flat, [{"field_name": "firstDestination", "answer": "京都"}])
+    assert flat["destination"] == ["京都", "東京", "大阪", "Москва"]
+    print("destinations ok")
+
+
+def main():
+    check_options()
+    check_ranges()
+    check_destinations()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Prefetch pays off only when turns search the keys it warmed. Checks that
+# turn queries about a prefetched topic at a destination are rewritten to the
+# template query, that anything more specific is left alone, and, through the
+# app with the fake LLM, that such a turn is served from the prefetched entry
+# (prefetch_hits) without a live search.
+#
+#   cd backend && python -m benchmarks.check_prefetch
+import time
+
+from prefetch import Prefetcher
+
+CITIES = ["Paris", "New York", "東京"]
+
+REWRITES = [
+    ("What's the weather like in Paris this week?", "weather in Paris"),
+    ("Is it going to rain in New York?", "weather in New York"),
+    ("What are the best attractions in Paris?", "attractions in Paris"),
+    ("places to visit in Paris", "attractions in Paris"),
+    ("things to do in new york", "things to do in New York"),
+    ("famous food in 東京", "food in 東京"),
+    # More specific than a template, or not a destination: searched as asked.
+    ("weather in Paris in July", "weather in Paris in July"),
+    ("cheap vegetarian restaurants in Paris", "cheap vegetarian restaurants in Paris"),
+    ("places to eat in Paris", "places to eat in Paris"),
+    ("weather in Rome", "weather in Rome"),
+    ("flights from Paris to 東京", "flights from Paris to 東京"),
+]
+
+
+def check_template_query():
+    prefetcher = Prefetcher(search=None)
+    try:
+        for query, expected in REWRITES:
+            got = prefetcher.template_query(query, CITIES)
+            assert got == expected, (query, got)
+    finally:
+        prefetcher.shutdown()
+    print(f"template queries ok ({len(REWRITES)} cases)")
+
+
+def check_prefetch_hits():
+    import app
+    from benchmarks.fakes import FakeLLMPool, FakeSearch, install
+    from metrics import counters
+
+    search = FakeSearch()
+    install(app, FakeLLMPool(), search)
+    client = app.app.test_client()
+    client.post("/api/initialize", json={"userId": "prefetch"})
+    client.post("/api/chat", json={"userId": "prefetch", "userInput": "Paris, Rome and Barcelona"})
+
+    prefetcher = app.app.extensions['travel_planner'].prefetcher
+    deadline = time.monotonic() + 5
+    while prefetcher._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    warmed = search.calls
+    assert warmed == 3 * len(prefetcher.queries), warmed
+
+    before = counters.get("prefetch_hits")
+    for question in ("What's the weather like in Paris this week?", "Is it raining in Rome today?"):
+        response = client.post("/api/chat", json={"userId": "prefetch", "userInput": question})
+        assert response.status_code == 200, response.json
+    assert counters.get("prefetch_hits") - before == 2
+    assert search.calls == warmed
+    print(f"prefetch hits ok ({warmed} prefetched searches, 2 turns served from them)")
+
+
+def main():
+    check_template_query()
+    check_prefetch_hits()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Behaviour of CachedSearch against a counting fake backend: hits and misses
+# under normalized keys, directional queries kept apart, filler-only queries
+# left uncached, per-intent TTL expiry and LRU eviction by bytes.
+#
+#   cd backend && python -m benchmarks.check_search_cache
+import re
+import sys
+import time
+
+from search_cache import CachedSearch, normalize_query
+
+
+class CountingSearch:
+    def __init__(self):
+        self.queries = []
+
+    def run(self, query):
+        self.queries.append(query)
+        return f"results for {query} #{len(self.queries)}"
+
+
+def check_hits_and_misses():
+    backend = CountingSearch()
+    search = CachedSearch(backend)
+    first = search.run("What's the weather in Paris?")
+    assert search.run("weather in paris") == first
+    assert search.run("  WEATHER   in Paris!! ") == first
+    assert len(backend.queries) == 1
+    search.run("weather in Rome")
+    assert len(backend.queries) == 2
+    print("hit/miss ok")
+
+
+def check_directional():
+    backend = CountingSearch()
+    search = CachedSearch(backend)
+    assert normalize_query("flights from Delhi to Dubai") != normalize_query("flights from Dubai to Delhi")
+    there = search.run("flights from Delhi to Dubai")
+    back = search.run("flights from Dubai to Delhi")
+    assert there != back and len(backend.queries) == 2
+    assert search.run("Flights from Delhi to Dubai?") == there
+    print("directional ok")
+
+
+def check_filler_only():
+    backend = CountingSearch()
+    search = CachedSearch(backend)
+    assert normalize_query("what is it?") == ""
+    search.run("what is it?")
+    search.run("where is this?")
+    assert len(backend.queries) == 2 and len(search) == 0
+    print("filler-only queries uncached ok")
+
+
+def check_ttl():
+    backend = CountingSearch()
+    intents = (("weather", re.compile(r"\bweather\b"), 0.05),)
+    search = CachedSearch(backend, intents=intents)
+    search.run("weather in Oslo")
+    search.run("weather in Oslo")
+    assert len(backend.queries) == 1
+    time.sleep(0.06)
+    search.run("weather in Oslo")
+    assert len(backend.queries) == 2
+    print("ttl ok")
+
+
+def check_lru():
+    backend = CountingSearch()
+    entry = sys.getsizeof(normalize_query("museums city0")) + sys.getsizeof(backend.run("museums city0"))
+    backend.queries.clear()
+    search = CachedSearch(backend, max_bytes=3 * entry + entry // 2)
+    for n in range(3):
+        search.run(f"museums city{n}")
+    search.run("museums city0")  # most recent now; city1 is the oldest
+    search.run("museums city3")  # over budget: evicts city1
+    assert len(search) == 3
+    calls = len(backend.queries)
+    search.run("museums city0")
+    search.run("museums city2")
+    assert len(backend.queries) == calls
+    search.run("museums city1")
+    assert len(backend.queries) == calls + 1
+    print("lru ok")
+
+
+def main():
+    check_hits_and_misses()
+    check_directional()
+    check_filler_only()
+    check_ttl()
+    check_lru()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Offline stand-ins for the upstreams: a fake LLM pool that answers with
+# schema-valid JSON for a scripted conversation, and a fake search tool.
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from history import count_tokens
+from metrics import record_tokens
+
+
+# A planning conversation: (user input, inferences the model should return,
+# metadata of the next question).
+CONVERSATION = [
+    ("hello", [], "none"),
+    ("Paris, Rome and Barcelona", [{"field_name": "destination", "answer": ["Paris", "Rome", "Barcelona"]}], "optimizeType"),
+    ("auto", [{"field_name": "optimizeType", "answer": "auto"}], "none"),
+    ("Paris first", [{"field_name": "firstDestination", "answer": "Paris"}], "none"),
+    ("I will start from New York", [{"field_name": "Origin_city", "answer": "New York"}], "budget"),
+    ("comfortable spending", [{"field_name": "budget", "answer": "comfortable spending"}], "food"),
+    ("european", [{"field_name": "food", "answer": "european"}], "traveller_type"),
+    ("couple", [{"field_name": "traveller_type", "answer": "couple"}], "trip_direction"),
+    ("return", [{"field_name": "trip_direction", "answer": "return"}], "none"),
+    ("leaving 10 am on 5th March, back on 15th March at 6 pm", [
+        {"field_name": "time_schedule_onward_trip_time_hour", "answer": 10},
+        {"field_name": "time_schedule_onward_trip_time_minute", "answer": 0},
+        {"field_name": "time_schedule_onward_trip_date_day_of_month", "answer": 5},
+        {"field_name": "time_schedule_onward_trip_date_month", "answer": 3},
+        {"field_name": "time_schedule_return_trip_time_hour", "answer": 18},
+        {"field_name": "time_schedule_return_trip_time_minute", "answer": 0},
+        {"field_name": "time_schedule_return_trip_date_day_of_month", "answer": 15},
+        {"field_name": "time_schedule_return_trip_date_month", "answer": 3},
+        {"field_name": "time_schedule_duration_value", "answer": 10},
+        {"field_name": "time_schedule_duration_unit", "answer": "days"},
+    ], "time_schedule_onward_trip_date_year"),
+    ("next_year", [
+        {"field_name": "time_schedule_onward_trip_date_year", "answer": "next_year"},
+        {"field_name": "time_schedule_return_trip_date_year", "answer": "next_year"},
+    ], "trip_theme"),
+    ("romantic", [{"field_name": "trip_theme", "answer": "romantic"}], "none"),
+    ("we love museums, old churches and good wine", [
+        {"field_name": "user_interest_historical_user_selected", "answer": True},
+        {"field_name": "user_interest_historical_weight", "answer": 0.5},
+        {"field_name": "user_interest_religion_user_selected", "answer": True},
+        {"field_name": "user_interest_religion_weight", "answer": 0.5},
+        {"field_name": "user_interest_food and wine_user_selected", "answer": True},
+        {"field_name": "user_interest_food and wine_weight", "answer": 0.5},
+    ], "none"),
+    ("that's all", [], "none"),
+]
+
+_RESPONSES = {text: (inferences, metadata) for text, inferences, metadata in CONVERSATION}
+_LAST_USER_LINE = re.compile(r"^\s*User: (.*)$", re.MULTILINE)
+_CHAT_HISTORY = re.compile(r"Chat history:\n(.*?)\n\s*Questions that need to be answered", re.DOTALL)
+
+
+class FakeLLMPool:
+    # Drop-in for the app's llm_pool. "gpt-4o" answers the main prompt from
+    # CONVERSATION; every other model (search check, history summary) says no
+    # search is needed. Each call sleeps latency +- jitter seconds.
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = {}
+        self.prompt_tokens = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get(self, model, temperature, timeout=None):
+        return RunnableLambda(
+            lambda prompt: self._call(model, prompt.to_string()),
+            afunc=lambda prompt: self._acall(model, prompt.to_string()),
+        )
+
+    def close(self):
+        pass
+
+    def _call(self, model, prompt):
+        delay = self._record(model, prompt)
+        if delay:
+            time.sleep(delay)
+        return self._answer(model, prompt)
+
+    async def _acall(self, model, prompt):
+        delay = self._record(model, prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._answer(model, prompt)
+
+    def _record(self, model, prompt):
+        with self._lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+            self.prompt_tokens.setdefault(model, []).append(count_tokens(prompt))
+            return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _answer(self, model, prompt):
+        # Stands in for the token callback, which a RunnableLambda never fires.
+        message = self._message(model, prompt)
+        record_tokens(model, count_tokens(prompt), count_tokens(message.content))
+        return message
+
+    def _message(self, model, prompt):
+        if model != "gpt-4o":
+            return AIMessage(content='{"internet_search_required": false, "online_search_query": null}')
+
+        history = _CHAT_HISTORY.search(prompt)
+        lines = _LAST_USER_LINE.findall(history.group(1)) if history else []
+        inferences, metadata = _RESPONSES.get(lines[-1].strip() if lines else "", ([], "none"))
+        return AIMessage(content=json.dumps({
+            "inferences": inferences,
+            "next_reply": "Thanks! Noted. Could you tell me a little more about your trip so I can plan it well?",
+            "metadata": metadata,
+            "reason": "scripted fake response",
+        }))
+
+
+class FakeSearch:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def run(self, query):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return f"Fake search results for {query}: sunny, 24C, museums open 9-18."
+
+
+# Points the backends of the module's default app (app.app) at the fakes.
+def install(app_module, llm_pool, search=None):
+    backends = app_module.app.extensions['travel_planner']
+    backends.llm_pool = llm_pool
+    if search is not None:
+        backends.search.backend = search
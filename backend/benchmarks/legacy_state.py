@@ -0,0 +1,109 @@
+# The hand-written flatten/unflatten that state.StateSchema replaced, kept
+# verbatim as the baseline for benchmarks.
+
+
+def flatten_json(nested_json):
+    flat_json = {}
+
+    flat_json["optimizeType"] = nested_json.get("optimizeType", {})
+    flat_json["firstDestination"] = nested_json.get("firstDestination", {})
+    flat_json["trip_theme"] = nested_json.get("trip_theme", {})
+    flat_json["destination"] = nested_json.get("destination", [])
+    flat_json["traveller_type"] = nested_json.get("traveller_type", {})
+    flat_json["Origin_city"] = nested_json.get("Origin_city", {})
+    flat_json["budget"] = nested_json.get("budget", {})
+    flat_json["food"] = nested_json.get("food", {})
+    flat_json["trip_direction"] = nested_json.get("trip_direction", {})
+
+    time_schedule = nested_json.get("time_schedule", {})
+    onward_trip = time_schedule.get("onward_trip", {})
+    return_trip = time_schedule.get("return_trip", {})
+    duration = time_schedule.get("duration", {})
+
+    flat_json["time_schedule_onward_trip_time_hour"] = onward_trip.get("time", {}).get("hour", {})
+    flat_json["time_schedule_onward_trip_time_minute"] = onward_trip.get("time", {}).get("minute", {})
+    flat_json["time_schedule_onward_trip_date_day_of_month"] = onward_trip.get("date", {}).get("day_of_month", {})
+    flat_json["time_schedule_onward_trip_date_month"] = onward_trip.get("date", {}).get("month", {})
+    flat_json["time_schedule_onward_trip_date_year"] = onward_trip.get("date", {}).get("year", {})
+
+    flat_json["time_schedule_return_trip_time_hour"] = return_trip.get("time", {}).get("hour", {})
+    flat_json["time_schedule_return_trip_time_minute"] = return_trip.get("time", {}).get("minute", {})
+    flat_json["time_schedule_return_trip_date_day_of_month"] = return_trip.get("date", {}).get("day_of_month", {})
+    flat_json["time_schedule_return_trip_date_month"] = return_trip.get("date", {}).get("month", {})
+    flat_json["time_schedule_return_trip_date_year"] = return_trip.get("date", {}).get("year", {})
+
+    flat_json["time_schedule_duration_value"] = duration.get("value", {})
+    flat_json["time_schedule_duration_unit"] = duration.get("unit", {})
+
+    user_interests = nested_json.get("user_interests", {})
+    for key, value in user_interests.items():
+        flat_json[f"user_interest_{key}_weight"] = value.get("weight", 0)
+        flat_json[f"user_interest_{key}_user_selected"] = value.get("user_selected", False)
+        flat_json[f"user_interest_{key}_places"] = value.get("places", [])
+        flat_json[f"user_interest_{key}_user_keywords"] = value.get("user_keywords", [])
+
+    return flat_json
+
+def unflatten_json(flat_json):
+    nested_json = {}
+
+    nested_json["optimizeType"] = flat_json.get("optimizeType", {})
+    nested_json["firstDestination"] = flat_json.get("firstDestination", {})
+    nested_json["trip_theme"] = flat_json.get("trip_theme", {})
+    nested_json["destination"] = flat_json.get("destination", [])
+    nested_json["traveller_type"] = flat_json.get("traveller_type", {})
+    nested_json["Origin_city"] = flat_json.get("Origin_city", {})
+    nested_json["budget"] = flat_json.get("budget", {})
+    nested_json["food"] = flat_json.get("food", {})
+    nested_json["trip_direction"] = flat_json.get("trip_direction", {})
+
+    time_schedule = {}
+    onward_trip = {}
+    return_trip = {}
+    duration = {}
+
+    onward_trip["time"] = {
+        "hour": flat_json.get("time_schedule_onward_trip_time_hour", {}),
+        "minute": flat_json.get("time_schedule_onward_trip_time_minute", {})
+    }
+    onward_trip["date"] = {
+        "day_of_month": flat_json.get("time_schedule_onward_trip_date_day_of_month", {}),
+        "month": flat_json.get("time_schedule_onward_trip_date_month", {}),
+        "year": flat_json.get("time_schedule_onward_trip_date_year", {})
+    }
+
+    return_trip["time"] = {
+        "hour": flat_json.get("time_schedule_return_trip_time_hour", {}),
+        "minute": flat_json.get("time_schedule_return_trip_time_minute", {})
+    }
+    return_trip["date"] = {
+        "day_of_month": flat_json.get("time_schedule_return_trip_date_day_of_month", {}),
+        "month": flat_json.get("time_schedule_return_trip_date_month", {}),
+        "year": flat_json.get("time_schedule_return_trip_date_year", {})
+    }
+
+    duration = {
+        "value": flat_json.get("time_schedule_duration_value", {}),
+        "unit": flat_json.get("time_schedule_duration_unit", {})
+    }
+
+    time_schedule["onward_trip"] = onward_trip
+    time_schedule["return_trip"] = return_trip
+    time_schedule["duration"] = duration
+
+    nested_json["time_schedule"] = time_schedule
+
+    user_interests = {}
+    for key in flat_json:
+        if key.startswith("user_interest_"):
+            interest_key = key.split("_")[2]  # Extracting the interest key from the flattened key
+            user_interests[interest_key] = {
+                "weight": flat_json.get(f"user_interest_{interest_key}_weight", 0),
+                "user_selected": flat_json.get(f"user_interest_{interest_key}_user_selected", False),
+                "places": flat_json.get(f"user_interest_{interest_key}_places", []),
+                "user_keywords": flat_json.get(f"user_interest_{interest_key}_user_keywords", [])
+            }
+    
+    nested_json["user_interests"] = user_interests
+
+    return nested_json
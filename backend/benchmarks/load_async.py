@@ -0,0 +1,90 @@
+# Concurrent sessions against the Flask app on a capped worker-thread pool
+# (the threaded dev server / gunicorn gthread model) and against the ASGI app
+# on one event loop. Upstreams are the fakes, so the numbers show how many
+# in-flight turns each model carries, not real OpenAI latency. Flask latencies
+# start once a worker picks the session up, so its queueing shows in wall time.
+#
+#   cd backend && python -m benchmarks.load_async [--workers 16] [--latency 0.2]
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+import asgi
+from benchmarks.fakes import CONVERSATION, FakeLLMPool, FakeSearch, install
+from benchmarks.load_test import percentile
+
+
+TURNS = [user_input for user_input, _, _ in CONVERSATION[:4]]
+
+
+def run_flask(sessions, workers, tag):
+    client = app.app.test_client()
+    latencies = []
+
+    def session(n):
+        user_id = f"{tag}-{n}"
+        client.post("/api/initialize", json={"userId": user_id})
+        for user_input in TURNS:
+            start = time.perf_counter()
+            response = client.post("/api/chat", json={"userId": user_id, "userInput": user_input})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.json
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(session, range(sessions)))
+    return time.perf_counter() - start, latencies
+
+
+def run_asgi(sessions, tag):
+    latencies = []
+
+    async def session(client, n):
+        user_id = f"{tag}-{n}"
+        await client.post("/api/initialize", json={"userId": user_id})
+        for user_input in TURNS:
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={"userId": user_id, "userInput": user_input})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, await response.get_json()
+
+    async def main():
+        client = asgi.asgi_app.test_client()
+        await asyncio.gather(*(session(client, n) for n in range(sessions)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[8, 32, 128, 512])
+    args = parser.parse_args()
+
+    install(app, FakeLLMPool(latency=args.latency, jitter=args.latency / 4), FakeSearch(latency=args.latency / 2))
+    app.app.config['TURN_CACHE_ENABLED'] = False
+
+    print(f"{len(TURNS)} turns per session, LLM latency {args.latency}s, {args.workers} Flask worker threads")
+    print(f"{'sessions':>8} {'server':<6} {'wall s':>8} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for sessions in args.sessions:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = {
+                "flask": run_flask(sessions, args.workers, f"flask-{sessions}"),
+                "asgi": run_asgi(sessions, f"asgi-{sessions}"),
+            }
+        for server, (wall, latencies) in results.items():
+            print(
+                f"{sessions:>8} {server:<6} {wall:>8.2f} {len(latencies) / wall:>8.1f} "
+                f"{percentile(latencies, 0.5) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
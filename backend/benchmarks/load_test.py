@@ -0,0 +1,172 @@
+# Load test of /api/initialize + /api/chat without spending API money: every
+# session replays the scripted CONVERSATION (greeting, destinations, budget,
+# dates, interests) against the fake LLM and search, all sessions at once, for
+# a growing number of concurrent sessions. Reports latency percentiles,
+# turns/s and process RSS, and writes the run to JSON for later comparison.
+#
+#   cd backend && python -m benchmarks.load_test [--sessions 1 8 32 128] [--latency 0.3 --jitter 0.1]
+#   cd backend && python -m benchmarks.load_test --server asgi --output before.json
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+
+import app
+from benchmarks.fakes import CONVERSATION, FakeLLMPool, FakeSearch, install
+from metrics import counters
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is missing.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_flask(sessions, turns, tag):
+    client = app.app.test_client()
+    latencies = []
+    errors = []
+    barrier = threading.Barrier(sessions)
+
+    def session(n):
+        user_id = f"{tag}-{n}"
+        client.post("/api/initialize", json={"userId": user_id})
+        barrier.wait()
+        for user_input in turns:
+            start = time.perf_counter()
+            response = client.post("/api/chat", json={"userId": user_id, "userInput": user_input})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.json)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, errors
+
+
+def run_asgi(sessions, turns, tag):
+    import asgi
+
+    latencies = []
+    errors = []
+
+    async def session(client, n):
+        user_id = f"{tag}-{n}"
+        await client.post("/api/initialize", json={"userId": user_id})
+        for user_input in turns:
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={"userId": user_id, "userInput": user_input})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(await response.get_json())
+
+    async def main():
+        client = asgi.asgi_app.test_client()
+        await asyncio.gather(*(session(client, n) for n in range(sessions)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - start, latencies, errors
+
+
+def run_level(server, sessions, turns):
+    tokens_before = counters.get("llm_prompt_tokens", model="gpt-4o")
+    runner = run_asgi if server == "asgi" else run_flask
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        wall, latencies, errors = runner(sessions, turns, f"load-{server}-{sessions}-{time.monotonic_ns()}")
+
+    return {
+        "sessions": sessions,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "turns_per_s": round(len(latencies) / wall, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "rss_mb": round(rss_bytes() / 2 ** 20, 1),
+        "prompt_tokens_per_turn": round((counters.get("llm_prompt_tokens", model="gpt-4o") - tokens_before) / len(latencies)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--latency", type=float, default=0.3, help="fake LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+- seconds around --latency")
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    parser.add_argument("--output", default=None, help="JSON file (default: benchmarks/results/load-<time>.json)")
+    args = parser.parse_args()
+
+    install(app, FakeLLMPool(latency=args.latency, jitter=args.jitter), FakeSearch(latency=args.search_latency))
+    app.app.config['TURN_CACHE_ENABLED'] = False
+    turns = [user_input for user_input, _, _ in CONVERSATION]
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    print(f"{args.server}: {len(turns)} turns per session, LLM latency {args.latency}s +- {args.jitter}s")
+    print(f"{'sessions':>8} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'errors':>7}")
+    levels = []
+    for sessions in args.sessions:
+        level = run_level(args.server, sessions, turns)
+        levels.append(level)
+        print(
+            f"{sessions:>8} {level['turns_per_s']:>8.1f} {level['p50_ms']:>8.0f} {level['p95_ms']:>8.0f} "
+            f"{level['p99_ms']:>8.0f} {level['rss_mb']:>8.1f} {level['errors']:>7}"
+        )
+
+    result = {
+        "started": started.isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "server": args.server,
+        "config": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "search_latency": args.search_latency,
+            "turns_per_session": len(turns),
+            "prompt_state_mode": app.app.config['PROMPT_STATE_MODE'],
+            "speculative_main_call": app.app.config['SPECULATIVE_MAIN_CALL'],
+            "local_search_router": app.app.config['LOCAL_SEARCH_ROUTER'],
+        },
+        "levels": levels,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", f"load-{args.server}-{started:%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Several worker processes, each with several threads, run /api/chat turns for
+# the same few users against one SQLite session store. Every turn must end up
+# in chat_history: no lost updates.
+#
+#   cd backend && python -m benchmarks.stress_session_store
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROCESSES = 4
+THREADS = 4
+TURNS = 10  # per thread
+USERS = ["alice", "bob"]
+
+
+def worker(db_path, index):
+    os.environ["SESSION_STORE"] = "sqlite"
+    os.environ["SESSION_DB_PATH"] = db_path
+    os.environ["LOCAL_SEARCH_ROUTER"] = "true"
+
+    import app
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+
+    # One answer for every chain: the search check reads the first two keys,
+    # the main prompt the rest.
+    def fake_model(prompt):
+        time.sleep(0.01)
+        return AIMessage(content=json.dumps({
+            "internet_search_required": False,
+            "online_search_query": None,
+            "inferences": [],
+            "next_reply": "ok",
+            "metadata": "none",
+            "reason": "stress",
+        }))
+
+    app.app.extensions['travel_planner'].llm_pool.get = lambda *args, **kwargs: RunnableLambda(fake_model)
+    client = app.app.test_client()
+
+    def run(thread):
+        for turn in range(TURNS):
+            for user in USERS:
+                response = client.post("/api/chat", json={
+                    "userId": user,
+                    "userInput": f"p{index} t{thread} turn {turn}",
+                })
+                assert response.status_code == 200, response.json
+
+    threads = [threading.Thread(target=run, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"process {index}: session_conflicts={app.counters.get('session_conflicts')}")
+
+
+def main():
+    sys.path.insert(0, os.getcwd())
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "sessions.db")
+
+        from session_store import SQLiteSessionStore
+        store = SQLiteSessionStore(db_path)
+        for user in USERS:
+            store.compare_and_set(user, 0, {"chat_history": ["Bot: hi"], "current_json": {}, "options": []})
+
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=worker, args=(db_path, i)) for i in range(PROCESSES)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+        elapsed = time.perf_counter() - started
+
+        expected = 1 + 2 * PROCESSES * THREADS * TURNS
+        for user in USERS:
+            version, data = store.get(user)
+            lines = data["chat_history"]
+            print(f"{user}: {len(lines)} lines (expected {expected}), version {version}")
+            assert len(lines) == expected, "turns were lost"
+            assert len(set(lines[1::2])) == PROCESSES * THREADS * TURNS
+        print(f"{PROCESSES * THREADS * TURNS * len(USERS)} turns in {elapsed:.1f}s, none lost")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from fields import details, options_list
+from state import is_default, state_schema
+
+# Only asked once the trip has more than one destination.
+MULTI_CITY_FIELDS = ("optimizeType", "firstDestination")
+
+# Not asked when the trip is one-way.
+RETURN_TRIP_PREFIX = "time_schedule_return_trip_"
+
+# Wording used instead of the one in `details`, where that repeats another
+# field's question.
+QUESTIONS = {
+    "time_schedule_return_trip_time_hour": "At what time would you like to start your return journey?",
+}
+
+
+# Answers a click on one of the option buttons without calling a model. When
+# the input is (case-insensitively) one of the options the last reply showed,
+# and those options belong to a field that is still unanswered, the choice is
+# recorded as that field's inference and the reply asks the next unanswered
+# question from `details`. respond() returns a response shaped like the main
+# model's, or None to leave the turn to the normal pipeline; that includes a
+# next field with no single question to ask (a date, the duration, interests).
+class OptionFastPath:
+    def __init__(self, fields=details["fields"], options=options_list, schema=state_schema):
+        self.defaults = schema.defaults
+        # Destination first, then the rest in the order the field definitions
+        # list them. Sub-prompts such as "Minute:" have no question of their
+        # own (None) and are left to the model.
+        self.questions = sorted(
+            (
+                (field["field_name"], self._question(field))
+                for field in fields
+                if field["field_name"] in schema.defaults
+            ),
+            key=lambda question: question[0] != "destination",
+        )
+        self.interest_keys = [key for key, path in schema.paths.items() if path[0] == "user_interests"]
+        self.options = options
+        self._by_options = {}  # tuple of options -> field names sharing them
+        for field_name, values in options.items():
+            self._by_options.setdefault(tuple(values), []).append(field_name)
+
+    def respond(self, user_input, shown_options, flat_json):
+        match = self.match(user_input, shown_options, flat_json)
+        if match is None:
+            return None
+
+        field_name, answer = match
+        answered = {**flat_json, field_name: answer}
+        next_field, question = self.next_question(answered)
+        if next_field is not None and question is None:
+            return None
+        if next_field is None:
+            next_reply = f'Great, noted "{answer}". Is there anything else you would like to add about your trip?'
+        else:
+            next_reply = f'Great, noted "{answer}". {question}'
+
+        return {
+            "inferences": [{"field_name": field_name, "answer": answer}],
+            "next_reply": next_reply,
+            "metadata": next_field if next_field in self.options else "none",
+        }
+
+    def match(self, user_input, shown_options, flat_json):
+        if not shown_options:
+            return None
+        text = user_input.strip().casefold()
+        answer = next((option for option in shown_options if str(option).casefold() == text), None)
+        if answer is None:
+            return None
+
+        # Several fields can share one option list (onward/return year); the
+        # buttons were for the first of them that is still open.
+        for field_name in self._by_options.get(tuple(shown_options), ()):
+            if self.unanswered(flat_json, field_name):
+                return field_name, answer
+        return None
+
+    # The first unanswered field and its question, (field, None) when it has
+    # none the fast path can ask, or (None, None) once everything is answered.
+    def next_question(self, flat_json):
+        multi_city = len(flat_json.get("destination") or []) > 1
+        oneway = flat_json.get("trip_direction") == "oneway"
+        for field_name, question in self.questions:
+            if field_name in MULTI_CITY_FIELDS and not multi_city:
+                continue
+            if oneway and field_name.startswith(RETURN_TRIP_PREFIX):
+                continue
+            if self.unanswered(flat_json, field_name):
+                return field_name, question
+        if all(self.unanswered(flat_json, key) for key in self.interest_keys):
+            return "user_interests", None
+        return None, None
+
+    @staticmethod
+    def _question(field):
+        question = QUESTIONS.get(field["field_name"], field.get("question") or "")
+        return question if question.endswith("?") else None
+
+    def unanswered(self, flat_json, field_name):
+        return is_default(flat_json.get(field_name, self.defaults[field_name]), self.defaults[field_name])
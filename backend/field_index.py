@@ -0,0 +1,162 @@
+import re
+
+from fields import options_list
+from metrics import counters
+from state import state_schema
+
+
+# Separators and punctuation: anything but letters, digits (in any script)
+# and "+".
+_SEPARATORS = re.compile(r"[^\w+]+|_+")
+
+
+def canon(text):
+    # "Family with Kids", "family-with kids" and " FAMILY_WITH_KIDS " are one
+    # key; "Köln" and "Koln", or "東京" and "大阪", are not.
+    return _SEPARATORS.sub("", str(text).casefold())
+
+
+# Other spellings of an option, by field; case and separators are already
+# handled by canon(). Only variants that can mean nothing else belong here:
+# a synonym ("moderate", "family", "round trip") is a guess, and the model is
+# asked to pick from the options instead.
+OPTION_ALIASES = {
+    "trip_theme": {"lgbtq+": "lbgtq+", "lgbtq": "lbgtq+", "lbgtq": "lbgtq+"},
+    "food": {"barbecue": "barbeque", "bbq": "barbeque"},
+    "optimizeType": {"automatic": "auto"},
+    "time_schedule_duration_unit": {"day": "days", "weeks": "week", "months": "month"},
+}
+
+# Inclusive bounds of the integer fields.
+RANGES = {
+    "_date_day_of_month": (1, 31),
+    "_date_month": (1, 12),
+    "_time_hour": (0, 23),
+    "_time_minute": (0, 59),
+    "time_schedule_duration_value": (1, 366),
+}
+
+# List fields where a list answer is the complete, final list (see the
+# destination instruction in details); a single item, and any answer for the
+# other list fields, is added to what is there.
+REPLACED_LISTS = frozenset({"destination"})
+
+
+class InvalidInference(ValueError):
+    pass
+
+
+# Everything needed to check one inference, computed once from the state
+# template and the option lists: field names by canonical form (so
+# "origin_city" or "user_interests_..." resolve), options and aliases by
+# canonical form, integer ranges and the kind of each field. Lookups are
+# single dict hits.
+class FieldIndex:
+    def __init__(self, options=options_list, aliases=OPTION_ALIASES, schema=state_schema):
+        self.defaults = schema.defaults
+        self.fields = {}  # canonical name -> flat key
+        for key, path in schema.paths.items():
+            self.fields[canon(key)] = key
+            if path[0] == "user_interests":
+                self.fields[canon("_".join(path))] = key
+
+        self.options = {}  # flat key -> {canonical answer: option}
+        for key, values in options.items():
+            table = {canon(value): value for value in values}
+            for alias, value in aliases.get(key, {}).items():
+                table.setdefault(canon(alias), value)
+            self.options[key] = table
+
+        self.ranges = {}
+        for key in schema.paths:
+            for suffix, bounds in RANGES.items():
+                if key.endswith(suffix):
+                    self.ranges[key] = bounds
+
+    def resolve_field(self, name):
+        return self.fields.get(canon(name))
+
+    def normalize(self, key, answer):
+        # The value to store for `answer`, or InvalidInference.
+        if key in self.options:
+            value = self.options[key].get(canon(answer))
+            if value is None:
+                raise InvalidInference(f"{answer!r} is not an option of {key}")
+            return value
+
+        if key in self.ranges:
+            try:
+                number = float(str(answer).strip())
+            except ValueError:
+                raise InvalidInference(f"{answer!r} is not a number for {key}") from None
+            if not number.is_integer():
+                raise InvalidInference(f"{answer!r} is not a whole number for {key}")
+            value = int(number)
+            low, high = self.ranges[key]
+            if not low <= value <= high:
+                raise InvalidInference(f"{value} is outside {low}-{high} for {key}")
+            return value
+
+        default = self.defaults[key]
+        if isinstance(default, bool):
+            if isinstance(answer, bool):
+                return answer
+            if canon(answer) in ("true", "yes", "1"):
+                return True
+            if canon(answer) in ("false", "no", "0"):
+                return False
+            raise InvalidInference(f"{answer!r} is not a boolean for {key}")
+        if isinstance(default, list):
+            items = answer if isinstance(answer, list) else [answer]
+            return [str(item).strip() for item in items if str(item).strip()]
+        if key.endswith("_weight"):
+            try:
+                return min(1.0, max(0.0, float(answer)))
+            except (TypeError, ValueError):
+                raise InvalidInference(f"{answer!r} is not a weight for {key}") from None
+
+        if isinstance(answer, (dict, list)) or not str(answer).strip():
+            raise InvalidInference(f"{answer!r} is not a value for {key}")
+        return str(answer).strip()
+
+    def apply(self, flat_json, inferences):
+        # Writes the valid inferences into flat_json; returns the rejected ones.
+        rejected = []
+        for update in inferences:
+            try:
+                key = self.resolve_field(update.get("field_name", ""))
+                if key is None:
+                    raise InvalidInference(f"unknown field {update.get('field_name')!r}")
+                value = self.normalize(key, update.get("answer"))
+            except (InvalidInference, AttributeError) as e:
+                rejected.append((update, str(e)))
+                counters.inc("inferences_rejected")
+                continue
+
+            if value != update.get("answer") or key != update.get("field_name"):
+                counters.inc("inferences_repaired")
+            if isinstance(value, list):
+                current = flat_json.get(key)
+                if not isinstance(current, list) or (key in REPLACED_LISTS and isinstance(update.get("answer"), list)):
+                    current = []
+                value = merge_unique(current, value)
+            flat_json[key] = value
+            counters.inc("inferences_applied")
+
+        # The first destination is one of the destinations too.
+        first = flat_json.get("firstDestination")
+        destinations = flat_json.get("destination")
+        if isinstance(first, str) and isinstance(destinations, list) and canon(first) not in map(canon, destinations):
+            flat_json["destination"] = [first] + destinations
+        return rejected
+
+
+def merge_unique(current, new):
+    # Order-preserving union, comparing case- and punctuation-insensitively.
+    seen = {canon(item) for item in current}
+    merged = list(current)
+    for item in new:
+        if canon(item) not in seen:
+            seen.add(canon(item))
+            merged.append(item)
+    return merged
@@ -0,0 +1,197 @@
+# Field definitions the bot walks the user through; also embedded in the main prompt.
+details = {
+    "fields": [
+        {
+            "field_name": "optimizeType",
+            "question": "Would you prefer to sequence the list of cities manually, or should we auto-sequence them for you?",
+            "options": ["manual", "auto"]
+        },
+        {
+            "field_name": "firstDestination",
+            "question": "Where would you like to go first?"
+        },
+        {
+            "field_name": "trip_theme",
+            "question": "What is the theme of your trip (e.g., adventure, beach, cultural)?",
+            "options": [
+                "romantic",
+                "family-vacation",
+                "eco-tourism",
+                "party",
+                "roadtrip",
+                "remote-work",
+                "business-work",
+                "health and wellness",
+                "spiritual",
+                "lbgtq+",
+                "adventure",
+                "general-tourism-no-theme"
+            ]
+        },
+        {
+            "field_name": "destination",
+            "question": "Could you provide the list of destinations you plan to visit?",
+            "instruction": "this will be a list so even in inference give back a list. if the user updates this then also give the final list in inference as whatever you give will be replaced with previous value"
+        },
+        {
+            "field_name": "traveller_type",
+            "question": "What type of traveler are you (e.g., solo, family, friends)?",
+            "options": [
+                "solo",
+                "couple",
+                "family-no kids",
+                "family-with kids",
+                "friends"
+            ]
+        },
+        {
+            "field_name": "Origin_city",
+            "question": "What is your city of origin?"
+        },
+        {
+            "field_name": "budget",
+            "question": "How would you describe your budget for this trip?",
+            "options": [
+                "on a tight budget",
+                "comfortable spending",
+                "happy to spend for a luxurious vacation"
+            ]
+        },
+        {
+            "field_name": "food",
+            "question": "Do you have any dietary preferences?",
+            "options": [
+                "any",
+                "Middle-eastern",
+                "indian",
+                "asian",
+                "european",
+                "mexican",
+                "vegetarian",
+                "south american",
+                "vegan",
+                "seafood",
+                "fast food",
+                "cafe",
+                "dessert",
+                "healthy",
+                "bar/pub",
+                "barbeque",
+                "pizza"
+            ]
+        },
+        {
+            "field_name": "trip_direction",
+            "question": "Is your trip one-way or round-trip?",
+            "options": ["return", "oneway"]
+        },
+        {
+            "field_name": "time_schedule_onward_trip_time_hour",
+            "question": "At what time would you like to depart?",
+            "value_option":  ["AM/PM" , "24Hour"],
+            "instructions": "user needs to specify if the time is in am or pm or in 24 hour format if you cannot infer this then ask user for clarification"
+        },
+        {
+            "field_name": "time_schedule_onward_trip_time_minute",
+            "question": "Minute:"
+        },
+        {
+            "field_name": "time_schedule_onward_trip_date_day_of_month",
+            "question": "Day of the month:",
+            "options": [1, 31]
+        },
+        {
+            "field_name": "time_schedule_onward_trip_date_month",
+            "question": "Month:",
+            "options": [1, 12]
+        },
+        {
+            "field_name": "time_schedule_onward_trip_date_year",
+            "question": "Year:",
+            "options": ["current_year", "next_year"]
+        },
+        {
+            "field_name": "time_schedule_return_trip_time_hour",
+            "question": "At what time would you like to depart?",
+            "value_option":  ["AM/PM" , "24Hour"],
+            "instructions": "user needs to specify if the time is in am or pm or in 24 hour format if you cannot infer this then ask user for clarification"
+        },
+        {
+            "field_name": "time_schedule_return_trip_time_minute",
+            "question": "Minute:"
+        },
+        {
+            "field_name": "time_schedule_return_trip_date_day_of_month",
+            "question": "Day of the month:",
+            "options": [1, 31]
+        },
+        {
+            "field_name": "time_schedule_return_trip_date_month",
+            "question": "Month:",
+            "options": [1, 12]
+        },
+        {
+            "field_name": "time_schedule_return_trip_date_year",
+            "question": "Year:",
+            "options": ["current_year", "next_year"]
+        },
+        {
+            "field_name": "time_schedule_duration_value",
+            "question": "Duration value:"
+        },
+        {
+            "field_name": "time_schedule_duration_unit",
+            "question": "Duration unit:",
+            "options": ["week", "month", "days"]
+        },
+        {
+            "field_name": "user_interest_interest-name",
+            "instructions": "Observe the conversation context and user input to infer the user's general interests for the trip. Set appropriate values for weight, user_selected, places, and user_keywords based on the discussion. Remember each field which you set true will start with an innitial weight of 0.5 and wiill increase by 0.1 every if user shows more interest in it (if he metions it again or says something to  indicates that he is more interested in that field. also allow the user to update the it anything they like. also in th ekeywords you have to records that user said that shows his interest in that) also if the user mentions any specific places regarding that then they should be in the respective places list field"
+        }
+    ]
+}
+
+
+# Value options the UI shows as buttons, keyed by flat field name.
+options_list = {
+    "trip_theme": [
+        "romantic", "family-vacation", "eco-tourism", "party", 
+        "roadtrip", "remote-work", "business-work", "health and wellness", 
+        "spiritual", "lbgtq+", "adventure", "general-tourism-no-theme"
+    ],
+    "traveller_type": [
+        "solo", "couple", "family-no kids", "family-with kids", "friends"
+    ],
+    "budget": [
+        "on a tight budget", "comfortable spending", 
+        "happy to spend for a luxurious vacation"
+    ],
+    "food": [
+        "any", "Middle-eastern", "indian", "asian", "european", 
+        "mexican", "vegetarian", "south american", "vegan", 
+        "seafood", "fast food", "cafe", "dessert", "healthy", 
+        "bar/pub", "barbeque", "pizza"
+    ],
+    "trip_direction": [
+        "return", "oneway"
+    ],
+    "optimizeType": [
+        "manual", "auto"
+    ],
+    "time_schedule_duration_unit": [
+        "week", "month", "days"
+    ],
+    "time_schedule_onward_trip_date_year": [
+        "current_year", "next_year"
+    ],
+    "time_schedule_return_trip_date_year": [
+        "current_year", "next_year"
+    ]
+}
+
+
+def get_options(field_name):
+    if field_name in options_list:
+        return options_list[field_name]
+    else:
+        return []
@@ -0,0 +1,94 @@
+import logging
+import threading
+
+from metrics import counters
+
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+
+def count_tokens(text):
+    # tiktoken ships with langchain_openai but may have to download its BPE
+    # file; fall back to the usual ~4 chars per token estimate if it can't.
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model("gpt-4o")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+# Builds the chat history that goes into the prompt: the last keep_lines lines
+# verbatim, preceded by a running summary of everything older. The summary is
+# extended in the background once enough lines have scrolled out of the
+# window, so a turn never waits for it; until it catches up, the unsummarized
+# lines stay in the window (trimmed to max_tokens). The summary lives in the
+# session itself as history_summary = [summarized_upto, text].
+class HistoryManager:
+    def __init__(self, summarize, store, executor, keep_lines=8, max_tokens=1500, summarize_every=4):
+        self.summarize = summarize  # (previous_summary, lines) -> summary
+        self.store = store  # SessionStore
+        self.executor = executor
+        self.keep_lines = keep_lines
+        self.max_tokens = max_tokens
+        self.summarize_every = summarize_every
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def window(self, user_id, user_data):
+        chat_history = user_data['chat_history']
+        summarized_upto, summary = user_data.get('history_summary') or (0, "")
+
+        start = max(summarized_upto, len(chat_history) - self.keep_lines)
+        if start - summarized_upto >= self.summarize_every:
+            self._schedule(user_id, chat_history, summarized_upto, summary, start)
+
+        lines = chat_history[summarized_upto:]
+        tokens = [count_tokens(line) for line in lines]
+        total = sum(tokens)
+        # Over budget: drop the oldest lines, but always keep the latest exchange.
+        while total > self.max_tokens and len(lines) > 2:
+            total -= tokens.pop(0)
+            lines = lines[1:]
+
+        if summary:
+            lines = [f"Summary of earlier conversation: {summary}"] + lines
+            total += count_tokens(lines[0])
+
+        counters.inc("history_turns")
+        counters.inc("history_tokens", total)
+        return lines
+
+    def _schedule(self, user_id, chat_history, summarized_upto, summary, upto):
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+
+        lines = list(chat_history[summarized_upto:upto])
+        self.executor.submit(self._summarize, user_id, summary, lines, upto)
+
+    def _summarize(self, user_id, summary, lines, upto):
+        try:
+            summary = self.summarize(summary, lines)
+
+            def record(data):
+                if data is None or (data.get('history_summary') or (0, ""))[0] >= upto:
+                    return None
+                data['history_summary'] = [upto, summary]
+                return data
+
+            self.store.update(user_id, record)
+            counters.inc("history_summaries")
+        except Exception as e:
+            counters.inc("history_summary_errors")
+            logger.warning("history summary failed: %s", e)
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
@@ -0,0 +1,22 @@
+import threading
+
+
+# Stands in for an object that is slow to import or build (the LLM clients,
+# the web search tool) until something first uses it. Attribute access goes
+# to the real object, which factory() builds once. The proxy's own names are
+# underscored so they never hide the real object's (LLMClientPool.get).
+class Lazy:
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
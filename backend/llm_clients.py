@@ -0,0 +1,80 @@
+import threading
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import ChatOpenAI
+
+from metrics import record_tokens
+
+
+# Counts prompt/completion tokens per model from the usage OpenAI reports.
+# Runs inline so the counts land in the calling turn's trace.
+class TokenUsageCallback(BaseCallbackHandler):
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                model = message.response_metadata.get("model_name") or (response.llm_output or {}).get("model_name", "unknown")
+                record_tokens(model, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+
+# One ChatOpenAI per (model, temperature) for the whole process, all sharing a
+# single keep-alive httpx pool, so a turn reuses warm TLS connections instead
+# of opening new ones for every call.
+class LLMClientPool:
+    def __init__(self, api_key, pool_size=20, timeout=60.0, max_retries=2, base_url=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        # Used by ainvoke() from the ASGI entry point.
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self.callbacks = [TokenUsageCallback()]
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, model, temperature, timeout=None):
+        key = (model, temperature)
+        chat_model = self._models.get(key)
+        if chat_model is None:
+            with self._lock:
+                chat_model = self._models.get(key)
+                if chat_model is None:
+                    chat_model = ChatOpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        model=model,
+                        temperature=temperature,
+                        timeout=self.timeout,
+                        max_retries=self.max_retries,
+                        http_client=self.http_client,
+                        http_async_client=self.http_async_client,
+                        callbacks=self.callbacks,
+                        stream_usage=True,
+                    )
+                    self._models[key] = chat_model
+
+        # A per-call timeout is forwarded to the OpenAI request options and
+        # leaves the shared instance untouched.
+        if timeout is not None:
+            return chat_model.bind(timeout=timeout)
+        return chat_model
+
+    def close(self):
+        with self._lock:
+            self._models.clear()
+        self.http_client.close()
+
+    async def aclose(self):
+        self.close()
+        await self.http_async_client.aclose()
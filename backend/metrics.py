@@ -0,0 +1,181 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+# Upper bounds in seconds; from a local cache hit up to a slow gpt-4o reply.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else name
+
+
+def _label_string(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+# Process-wide counters (cache hits, speculation outcomes, ...). Cheap enough to
+# bump on every turn from any worker thread. Keyword arguments are labels, e.g.
+# inc("llm_prompt_tokens", 812, model="gpt-4o").
+class Counters:
+    def __init__(self):
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def get(self, name, **labels):
+        return self._values.get(_key(name, labels), 0)
+
+    def ratio(self, hits, misses):
+        total = self.get(hits) + self.get(misses)
+        return self.get(hits) / total if total else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            values = dict(self._values)
+        return {
+            key if isinstance(key, str) else f"{key[0]}{{{_label_string(key[1])}}}": value
+            for key, value in values.items()
+        }
+
+    def items(self):
+        # (name, labels, value), for the Prometheus rendering
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            name, labels = (key, ()) if isinstance(key, str) else key
+            yield name, labels, value
+
+
+# Fixed-bucket histograms in the Prometheus layout (cumulative on render).
+class Histograms:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._values = {}  # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def items(self):
+        # (name, labels, cumulative bucket counts incl. +Inf, sum)
+        with self._lock:
+            values = {key: list(entry) for key, entry in self._values.items()}
+        for key, entry in values.items():
+            name, labels = (key, ()) if isinstance(key, str) else key
+            cumulative = []
+            total = 0
+            for count in entry[:-1]:
+                total += count
+                cumulative.append(total)
+            yield name, labels, cumulative, entry[-1]
+
+
+# Values read at scrape time (resident bytes, queue lengths, ...), so keeping
+# them current costs nothing on the request path.
+class Gauges:
+    def __init__(self):
+        self._sources = {}  # name -> fn() -> number
+        self._lock = threading.Lock()
+
+    def register(self, name, fn):
+        with self._lock:
+            self._sources[name] = fn
+
+    def items(self):
+        with self._lock:
+            sources = dict(self._sources)
+        for name, fn in sources.items():
+            try:
+                yield name, fn()
+            except Exception:
+                continue
+
+
+counters = Counters()
+histograms = Histograms()
+gauges = Gauges()
+
+
+# Per-turn record of stage timings and token counts, for the sampled turn log.
+# Stages timed outside a trace_turn() block only go to the histograms.
+_turn = contextvars.ContextVar("turn_trace", default=None)
+
+
+@contextmanager
+def trace_turn():
+    trace = {"stages": {}, "tokens": {}}
+    token = _turn.set(trace)
+    try:
+        yield trace
+    finally:
+        _turn.reset(token)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histograms.observe("stage_seconds", elapsed, stage=stage)
+        trace = _turn.get()
+        if trace is not None:
+            trace["stages"][stage] = trace["stages"].get(stage, 0.0) + elapsed
+
+
+def record_tokens(model, prompt_tokens, completion_tokens):
+    counters.inc("llm_calls", model=model)
+    counters.inc("llm_prompt_tokens", prompt_tokens, model=model)
+    counters.inc("llm_completion_tokens", completion_tokens, model=model)
+    trace = _turn.get()
+    if trace is not None:
+        prompt, completion = trace["tokens"].get(model, (0, 0))
+        trace["tokens"][model] = (prompt + prompt_tokens, completion + completion_tokens)
+
+
+# Text exposition format for a Prometheus scrape of /metrics.
+def render_prometheus(prefix="travel_planner_"):
+    lines = []
+    seen = set()
+    for name, labels, value in sorted(counters.items()):
+        metric = f"{prefix}{name}_total"
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{{{_label_string(labels)}}} {value}" if labels else f"{metric} {value}")
+
+    for name, value in sorted(gauges.items()):
+        lines.append(f"# TYPE {prefix}{name} gauge")
+        lines.append(f"{prefix}{name} {value}")
+
+    for name, labels, cumulative, total in sorted(histograms.items()):
+        metric = f"{prefix}{name}"
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        label_prefix = _label_string(labels) + "," if labels else ""
+        bounds = [str(bound) for bound in histograms.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, cumulative):
+            lines.append(f'{metric}_bucket{{{label_prefix}le="{bound}"}} {count}')
+        suffix = f"{{{_label_string(labels)}}}" if labels else ""
+        lines.append(f"{metric}_sum{suffix} {total}")
+        lines.append(f"{metric}_count{suffix} {cumulative[-1]}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,109 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import counters
+from search_cache import normalize_query
+
+
+# What the next turns usually ask once a city is known. Keys are normalized
+# like user queries, so "weather in Paris" also serves "What's the weather in
+# Paris?".
+DEFAULT_PREFETCH_QUERIES = (
+    "weather in {city}",
+    "attractions in {city}",
+    "things to do in {city}",
+    "food in {city}",
+)
+
+# The words that ask for each template's topic. A turn query made of one
+# topic, a destination and filler only is searched as the template query (see
+# Prefetcher.template_query), so it hits the prefetched entry.
+PREFETCH_TOPICS = {
+    "weather in {city}": frozenset("weather forecast temperature rain raining snow".split()),
+    "attractions in {city}": frozenset("attractions sights sightseeing landmarks places".split()),
+    "things to do in {city}": frozenset("things activities".split()),
+    "food in {city}": frozenset("food cuisine dishes eat".split()),
+}
+
+# Words that can surround a topic without changing what is asked, after
+# normalize_query() has dropped the usual filler.
+_TOPIC_FILLER = frozenset("to see visit like now today tomorrow week weekend going famous popular must local typical".split())
+
+
+# Warms a CachedSearch with templated searches for a session's destinations on
+# a small thread pool, so later turns that ask about them hit the cache instead
+# of waiting on a live search. Queries already cached or being fetched are
+# skipped. cancel(user_id) drops whatever of a session's work has not started.
+# A prefetch only pays off when a turn later searches a query with the same
+# normalized key; watch prefetch_hits against prefetch_searches.
+#
+# Counters: prefetch_searches (fetched), prefetch_skipped (already there),
+# prefetch_cancelled, prefetch_errors; CachedSearch counts prefetch_hits when a
+# turn is served from a prefetched entry.
+class Prefetcher:
+    def __init__(self, search, queries=DEFAULT_PREFETCH_QUERIES, max_workers=4):
+        self.search = search  # CachedSearch
+        self.queries = queries
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._pending = {}  # user_id -> set of futures not yet finished
+        self._inflight = set()  # normalized keys being fetched
+        self._lock = threading.Lock()
+
+    def prefetch(self, user_id, cities):
+        for city in cities:
+            for template in self.queries:
+                query = template.format(city=city)
+                key = normalize_query(query)
+                if not key:
+                    continue
+                with self._lock:
+                    if key in self._inflight or self.search.contains(key):
+                        counters.inc("prefetch_skipped")
+                        continue
+                    self._inflight.add(key)
+                    future = self.executor.submit(self._fetch, query, key)
+                    self._pending.setdefault(user_id, set()).add(future)
+                future.add_done_callback(lambda future, user_id=user_id, key=key: self._done(user_id, key, future))
+
+    # The template query for `query` when it asks one prefetched topic about
+    # one of `cities` and nothing more ("What's the weather like in Paris this
+    # week?" -> "weather in Paris"); otherwise `query` unchanged.
+    def template_query(self, query, cities):
+        words = normalize_query(query).split()
+        for city in cities:
+            city_words = normalize_query(city).split()
+            size = len(city_words)
+            at = next((i for i in range(len(words) - size + 1) if size and words[i:i + size] == city_words), None)
+            if at is None:
+                continue
+            rest = set(words[:at] + words[at + size:]) - _TOPIC_FILLER
+            topics = [template for template in self.queries if PREFETCH_TOPICS.get(template, frozenset()) & rest]
+            if len(topics) == 1 and rest <= PREFETCH_TOPICS[topics[0]]:
+                return topics[0].format(city=city)
+        return query
+
+    def cancel(self, user_id):
+        with self._lock:
+            futures = self._pending.pop(user_id, ())
+        cancelled = sum(future.cancel() for future in futures)
+        if cancelled:
+            counters.inc("prefetch_cancelled", cancelled)
+
+    def _fetch(self, query, key):
+        try:
+            self.search.put(key, self.search.backend.run(query), prefetched=True)
+            counters.inc("prefetch_searches")
+        except Exception:
+            counters.inc("prefetch_errors")
+
+    def _done(self, user_id, key, future):
+        with self._lock:
+            self._inflight.discard(key)
+            futures = self._pending.get(user_id)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self._pending[user_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
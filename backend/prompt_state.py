@@ -0,0 +1,62 @@
+import json
+
+from state import is_default, state_schema
+
+
+PROMPT_STATE_MODES = ("full", "compact", "unanswered", "summary")
+
+
+# Renders the flat state for the "Questions that need to be answered" part of
+# the prompt. "full" is the original indented dump of every key; the other
+# modes are minified and list only the interests that have been touched,
+# which removes most of the 64 user_interest_* entries.
+#
+#   compact     every non-interest field, plus touched interests
+#   unanswered  names of the unanswered fields, plus touched interests
+#   summary     answered fields with their values, unanswered names, touched interests
+#
+# A field counts as answered when it differs from the template default.
+class PromptStateEncoder:
+    def __init__(self, schema=state_schema):
+        self.fields = []  # (flat key, default)
+        self.interests = {}  # interest name -> [(flat key, default)]
+        for key, path in schema.paths.items():
+            default = schema.defaults[key]
+            if path[0] == "user_interests":
+                self.interests.setdefault(path[1], []).append((key, default))
+            else:
+                self.fields.append((key, default))
+        self.interest_names = list(self.interests)
+
+    def encode(self, flat, mode="compact"):
+        if mode == "full":
+            return json.dumps(flat, indent=4)
+
+        touched = {}
+        for name, keys in self.interests.items():
+            if any(not is_default(flat.get(key, default), default) for key, default in keys):
+                touched.update((key, flat.get(key, default)) for key, default in keys)
+
+        if mode == "compact":
+            state = {key: flat.get(key, default) for key, default in self.fields}
+            state.update(touched)
+        elif mode == "unanswered":
+            state = {
+                "unanswered": [key for key, default in self.fields if is_default(flat.get(key, default), default)],
+                "interests": touched,
+            }
+        elif mode == "summary":
+            answered = {}
+            unanswered = []
+            for key, default in self.fields:
+                value = flat.get(key, default)
+                if is_default(value, default):
+                    unanswered.append(key)
+                else:
+                    answered[key] = value
+            state = {"answered": answered, "unanswered": unanswered, "interests": touched}
+        else:
+            raise ValueError(f"unknown prompt state mode {mode!r}")
+
+        state["available_interests"] = self.interest_names
+        return json.dumps(state, separators=(",", ":"))
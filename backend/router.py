@@ -0,0 +1,113 @@
+import re
+
+from fields import options_list
+
+
+# Phrases that only a live lookup can answer well.
+_TIME_SENSITIVE = re.compile(
+    r"\b("
+    r"weather|forecast|temperature|rain(ing|y)?|snow(ing)?|"
+    r"news|latest|current(ly)?|right now|today'?s|tonight|this (week|weekend|month)|"
+    r"prices?|fares?|how much (is|are|does|do)|cost of|tickets? (price|cost)s?|exchange rate|"
+    r"open(ing)? (hours|times)|open now|still open|closed (today|now|on)|timings?|"
+    r"visa|travel advisory|(travel|entry|covid|visa) restrictions?|strikes?|events?|festivals?|concerts? (in|this)|"
+    r"(flights?|trains?|buses|ferries) from"
+    r")\b",
+    re.IGNORECASE,
+)
+
+# Places to stay, eat or go out: the base prompt has these looked up. Lodging
+# always; food and venues when tied to a place ("restaurants open late in
+# Rome"), not as interests ("we love bars").
+_LOOKUP = re.compile(
+    r"\b("
+    r"hotels?|hostels?|motels?|resorts?|accommodations?|airbnbs?|b&bs?|guest ?houses?|places? to stay|where to stay|"
+    r"(restaurants?|cafes?|bars?|pubs?|clubs?|eateries|museums?|galleries|shops?|markets?)\b.*\b(near|nearby|close to|around|in|open)|"
+    r"(near|nearby|close to) (the|our|my)"
+    r")\b",
+    re.IGNORECASE,
+)
+
+_GREETING = re.compile(
+    r"^(hi+|hello+|hey+|hiya|good (morning|afternoon|evening)|thanks?( you)?|thank u|ok(ay)?|"
+    r"yes|yeah|yep|no|nope|sure|great|cool|fine|perfect|sounds good|that'?s all)[\s!.]*$",
+    re.IGNORECASE,
+)
+
+_MONTHS = (
+    r"jan(uary)?|feb(ruary)?|mar(ch)?|apr(il)?|may|june?|july?|aug(ust)?|"
+    r"sep(t|tember)?|oct(ober)?|nov(ember)?|dec(ember)?"
+)
+
+# Dates, times, durations and bare numbers, e.g. "10 am on 5th March".
+_SCHEDULE = re.compile(
+    r"^(on|at|from|to|by|around|the|for|and|till|until|about|of|in|,|\s|"
+    r"\d{1,2}(:\d{2})?\s*(am|pm|a\.m\.|p\.m\.|hrs?|hours?)?|"
+    r"\d{1,2}(st|nd|rd|th)?|\d{4}|\d{1,2}[/.-]\d{1,2}([/.-]\d{2,4})?|"
+    rf"{_MONTHS}|"
+    r"days?|nights?|weeks?|months?|noon|midnight|morning|evening|night|"
+    r"next year|this year|one|two|three|four|five|six|seven|eight|nine|ten"
+    r")+[.!]*$",
+    re.IGNORECASE,
+)
+
+# A bare list of names ("Paris, Rome and Barcelona", "New York", "Rome first,
+# then Florence and Venice"): the answer to a destination or origin question.
+# Checked on the input as typed, since capitals are what mark the names.
+_NAME_WORD = r"(?:[A-Z][\w'.-]*|and|or|then|first|last|&)"
+_NAME_LIST = re.compile(rf"^\s*{_NAME_WORD}(?:[\s,]+{_NAME_WORD})*[\s,.!]*$")
+
+# A lookup is searched only when it is asked for: a question, or an input
+# that starts with the thing to look up ("cheap hotels in Rome", "weather in
+# Rome"). The same words in a statement ("I'm currently in Mumbai", "we love
+# music festivals") are left to the classifier.
+_QUESTION_START = re.compile(
+    r"^(what'?s?|which|where|when|how|why|who|is|are|do|does|did|can|could|will|would|should|any|"
+    r"tell me|show me|find|search|look up|check)\b",
+    re.IGNORECASE,
+)
+_LOOKUP_MODIFIERS = re.compile(r"^((cheap(est)?|best|good|top|nearby|local|late|open|affordable|luxury)\s+)+", re.IGNORECASE)
+
+_QUESTION_WORDS = re.compile(
+    r"\b(what|which|where|when|how|why|who|can|could|would|should|is|are|do|does|"
+    r"tell|suggest|recommend|best|top|find|show|any ideas)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize(text):
+    return " ".join(text.lower().split()).strip(" .!")
+
+
+# Decides locally whether a turn needs a web search. route() returns the same
+# dict shape as gpt_call_with_internet_search when the answer is clear, or None
+# when the LLM classifier should decide. Only clear cases are decided: lookups
+# of live or local information asked as a question or a search phrase, and
+# answers to the bot's own questions (an option, a greeting, a date or time,
+# a list of place names).
+class SearchRouter:
+    def __init__(self, options=options_list, max_answer_words=6):
+        self.options = {normalize(str(option)) for values in options.values() for option in values}
+        self.max_answer_words = max_answer_words
+
+    def route(self, user_input):
+        text = normalize(user_input)
+        if not text:
+            return None
+
+        if (_TIME_SENSITIVE.search(text) or _LOOKUP.search(text)) and self._asks(text):
+            return {"internet_search_required": True, "online_search_query": user_input.strip()}
+
+        if text in self.options or _GREETING.match(text) or _SCHEDULE.match(text):
+            return {"internet_search_required": False, "online_search_query": None}
+
+        if len(text.split()) <= self.max_answer_words and not _QUESTION_WORDS.search(text) and _NAME_LIST.match(user_input):
+            return {"internet_search_required": False, "online_search_query": None}
+
+        return None
+
+    def _asks(self, text):
+        if text.endswith("?") or _QUESTION_START.match(text):
+            return True
+        subject = _LOOKUP_MODIFIERS.sub("", text)
+        return bool(_TIME_SENSITIVE.match(subject) or _LOOKUP.match(subject))
@@ -0,0 +1,230 @@
+import datetime
+import re
+
+from state import is_default, state_schema
+
+
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTH = (
+    r"(?P<{name}>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+    r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+)
+_DAY = r"(?P<{name}>[12][0-9]|3[01]|0?[1-9])(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s*(?P<{name}>20\d\d))?"
+
+# "5th March", "5 of March 2026", "March 5", "Mar 5th, 2026", "2026-03-05"
+_DATE = re.compile(
+    r"\b(?:"
+    + _DAY.format(name="day1") + r"\s+(?:of\s+)?" + _MONTH.format(name="month1") + _YEAR.format(name="year1")
+    + r"|" + _MONTH.format(name="month2") + r"\s+" + _DAY.format(name="day2") + r"\b" + _YEAR.format(name="year2")
+    + r"|(?P<year3>20\d\d)-(?P<month3>0?[1-9]|1[0-2])-(?P<day3>[12][0-9]|3[01]|0?[1-9])"
+    + r")",
+    re.IGNORECASE,
+)
+
+# "10 am", "6:30pm", "10 a.m.", "18:00", "noon", "midnight". A bare "at 10"
+# is left to the model, which asks whether it is AM or PM.
+_TIME = re.compile(
+    r"\b(?:(?P<hour>1[0-2]|0?[1-9])(?::(?P<minute>[0-5]\d))?\s*(?P<meridiem>[ap])\.?\s?m\b\.?"
+    r"|(?P<hour24>[01]?\d|2[0-3]):(?P<minute24>[0-5]\d)\b(?:\s*(?:hrs?|hours?)\b)?"
+    r"|(?P<named>noon|midday|midnight))",
+    re.IGNORECASE,
+)
+
+_NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "fourteen": 14, "fifteen": 15, "twenty": 20, "thirty": 30,
+}
+_DURATION = re.compile(
+    r"\b(?P<value>\d{1,3}|" + "|".join(_NUMBERS) + r")[\s-]+(?P<unit>days?|weeks?|months?)\b",
+    re.IGNORECASE,
+)
+_UNITS = {"day": "days", "week": "week", "month": "month"}
+_DAY_TRIP = re.compile(r"[\s-]*trips?\b", re.IGNORECASE)  # "a day trip" is an outing, not the duration
+
+# A duration counts only as the length of the trip: "for (about) 2 weeks",
+# "a 10-day trip". "3 days in Rome", "200 euros a day" are not.
+_FOR = re.compile(r"\bfor\s+(?:about\s+|around\s+|roughly\s+|approximately\s+)?$", re.IGNORECASE)
+_TRIP_NOUN = re.compile(r"\s+(?:trip|vacation|holiday|journey|getaway)\b", re.IGNORECASE)
+
+# A time counts only after a travel verb in the same clause: "leaving 10 am",
+# "the flight leaves at 21:45", "back on 20th March at 9 pm".
+_TRIP_VERB = re.compile(
+    r"\b(?:leav(?:e|es|ing)|depart(?:s|ing|ure)?|fly(?:ing)?|flight|take off|start(?:s|ing)?|"
+    r"arriv(?:e|es|ing|al)|back|return(?:s|ing)?)\b",
+    re.IGNORECASE,
+)
+_CLAUSE_END = re.compile(r"[,;.!?]")
+
+# Questions ("Is the Louvre open at 10 am?") are about the trip, not its schedule.
+_QUESTION = re.compile(r"[^.!?]*\?")
+
+_YEAR_WORDS = re.compile(r"\b(?P<which>next|this|current)[\s_]year\b", re.IGNORECASE)
+
+# Whatever follows one of these is about the way back.
+_RETURN = re.compile(r"\b(?:back|return(?:ing)?|until|till|through)\b", re.IGNORECASE)
+
+
+def _year_option(year, today):
+    if year == today.year:
+        return "current_year"
+    if year == today.year + 1:
+        return "next_year"
+    return None
+
+
+# Deterministic pass over the user input for the time_schedule_* fields: dates,
+# times (converted to 24h, minutes default to 00) and durations. Returns the
+# still unanswered flat fields it is sure about, which the main call gets as
+# hints to confirm; nothing is written into the state from here. Questions,
+# times without a travel verb and durations that are not clearly the trip's
+# length are left out, and so is anything else ambiguous.
+#
+# The first date/time is the onward trip and the second the return; once the
+# input says "back", "returning", "until", ... everything after that is the
+# return trip. When both dates are known and no duration was given, the
+# duration is computed in days.
+def extract_schedule(text, flat_json, today=None):
+    today = today or datetime.date.today()
+    text = _QUESTION.sub(" ", text)
+    split = _RETURN.search(text)
+    split_at = split.start() if split else len(text)
+
+    dates = [(match.start(), _parse_date(match, today)) for match in _DATE.finditer(text)]
+    dates = [(position, date) for position, date in dates if date is not None]
+    times = [(match.start(), _parse_time(match)) for match in _TIME.finditer(text) if _after_trip_verb(text, match.start())]
+
+    found = {}
+    for trip, (date, time) in zip(("onward_trip", "return_trip"), _assign(dates, times, split_at, split is not None)):
+        prefix = f"time_schedule_{trip}"
+        if date is not None:
+            day, month, year = date
+            found[f"{prefix}_date_day_of_month"] = day
+            found[f"{prefix}_date_month"] = month
+            if year is not None:
+                found[f"{prefix}_date_year"] = year
+        if time is not None:
+            found[f"{prefix}_time_hour"], found[f"{prefix}_time_minute"] = time
+
+    year_words = _YEAR_WORDS.search(text)
+    if year_words:
+        year = "next_year" if year_words.group("which").lower() == "next" else "current_year"
+        for trip in ("onward_trip", "return_trip"):
+            key = f"time_schedule_{trip}_date_year"
+            if key not in found and (f"time_schedule_{trip}_date_month" in found or trip == "onward_trip"):
+                found[key] = year
+
+    found = {key: value for key, value in found.items() if _unanswered(flat_json, key)}
+    if not (_unanswered(flat_json, "time_schedule_duration_value") and _unanswered(flat_json, "time_schedule_duration_unit")):
+        return found
+
+    duration = _trip_duration(text)
+    if duration:
+        value = duration.group("value").lower()
+        found["time_schedule_duration_value"] = int(value) if value.isdigit() else _NUMBERS[value]
+        found["time_schedule_duration_unit"] = _UNITS[duration.group("unit").lower().rstrip("s")]
+    else:
+        days = _days_between({**flat_json, **found}, today)
+        if days is not None:
+            found["time_schedule_duration_value"] = days
+            found["time_schedule_duration_unit"] = "days"
+
+    return found
+
+
+def _unanswered(flat_json, key):
+    default = state_schema.defaults[key]
+    return is_default(flat_json.get(key, default), default)
+
+
+def _after_trip_verb(text, position):
+    clause_start = max((match.end() for match in _CLAUSE_END.finditer(text, 0, position)), default=0)
+    return _TRIP_VERB.search(text, clause_start, position) is not None
+
+
+# The one duration that is clearly the trip's length, or None. Several numbered
+# durations ("for 3 days in Rome and 4 days in Paris") are per-stop, not the trip.
+def _trip_duration(text):
+    trip, numbered = [], 0
+    for match in _DURATION.finditer(text):
+        single = match.group("value").lower() in ("a", "an", "one")
+        if single and _DAY_TRIP.match(text, match.end()):
+            continue
+        numbered += not single
+        if _FOR.search(text, 0, match.start()) or _TRIP_NOUN.match(text, match.end()):
+            trip.append(match)
+    if len(trip) != 1 or numbered > 1:
+        return None
+    return trip[0]
+
+
+def _parse_date(match, today):
+    for n in "123":
+        day = match.group(f"day{n}")
+        if day is not None:
+            month = match.group(f"month{n}")
+            month = int(month) if month.isdigit() else _MONTHS[month[:3].lower()]
+            day = int(day)
+            try:
+                datetime.date(2000, month, day)  # leap year, so 29 Feb passes
+            except ValueError:
+                return None
+            year = match.group(f"year{n}")
+            return day, month, _year_option(int(year), today) if year else None
+    return None
+
+
+def _parse_time(match):
+    if match.group("named"):
+        return (0, 0) if match.group("named").lower() == "midnight" else (12, 0)
+    if match.group("hour24") is not None:
+        return int(match.group("hour24")), int(match.group("minute24"))
+    hour = int(match.group("hour")) % 12
+    if match.group("meridiem").lower() == "p":
+        hour += 12
+    return hour, int(match.group("minute") or 0)
+
+
+def _assign(dates, times, split_at, has_split):
+    if has_split:
+        onward = (_first(dates, 0, split_at), _first(times, 0, split_at))
+        back = (_first(dates, split_at, None), _first(times, split_at, None))
+        return onward, back
+    return (
+        (dates[0][1] if dates else None, times[0][1] if times else None),
+        (dates[1][1] if len(dates) > 1 else None, times[1][1] if len(times) > 1 else None),
+    )
+
+
+def _first(items, start, end):
+    return next((value for position, value in items if position >= start and (end is None or position < end)), None)
+
+
+def _days_between(flat, today):
+    try:
+        onward = _resolve(flat, "onward_trip", today)
+        back = _resolve(flat, "return_trip", today, after=onward)
+    except (TypeError, ValueError):
+        return None
+    if onward is None or back is None:
+        return None
+    return (back - onward).days
+
+
+def _resolve(flat, trip, today, after=None):
+    day = flat.get(f"time_schedule_{trip}_date_day_of_month")
+    month = flat.get(f"time_schedule_{trip}_date_month")
+    if not isinstance(day, int) or not isinstance(month, int):
+        return None
+    option = flat.get(f"time_schedule_{trip}_date_year")
+    year = {"current_year": today.year, "next_year": today.year + 1}.get(option) if isinstance(option, str) else None
+    if year is None:
+        year = after.year if after is not None else today.year
+    date = datetime.date(year, month, day)
+    if after is not None and date < after and option not in ("current_year", "next_year"):
+        date = date.replace(year=date.year + 1)  # back in the new year
+    return date
@@ -0,0 +1,115 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import counters
+
+
+# Filler only: words that give a query its direction ("from", "to") are kept,
+# and so is the word order, so "flights from Delhi to Dubai" and "flights from
+# Dubai to Delhi" stay two keys.
+_STOP_WORDS = frozenset(
+    "a an and are at be best can could do does for good how i in is it "
+    "me my of on or please show some tell the there this top what whats "
+    "when where which will with would you".split()
+)
+
+# Letters and digits in any script, so "weather in 東京" and "weather in 大阪"
+# are two keys.
+_WORD = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+# Intent -> (pattern, ttl in seconds). First match wins; weather goes stale
+# within the hour, attractions hardly ever.
+DEFAULT_INTENT_TTLS = (
+    ("weather", re.compile(r"\b(weather|forecast|temperature|rain|snow)\b"), 30 * 60),
+    ("news", re.compile(r"\b(news|latest|current|today|tonight|strike|advisory)\b"), 60 * 60),
+    ("prices", re.compile(r"\b(price|prices|fare|fares|cost|ticket|tickets|exchange)\b"), 6 * 60 * 60),
+    ("hours", re.compile(r"\b(open|opening|hours|closed|timings)\b"), 24 * 60 * 60),
+    ("events", re.compile(r"\b(event|events|festival|festivals|concert|concerts)\b"), 24 * 60 * 60),
+)
+DEFAULT_TTL = 7 * 24 * 60 * 60  # attractions, food, history, ...
+
+
+def normalize_query(query):
+    words = (word.replace("'", "") for word in _WORD.findall(query.casefold()))
+    return " ".join(word for word in words if word and word not in _STOP_WORDS)
+
+
+def query_intent(key, intents=DEFAULT_INTENT_TTLS):
+    for name, pattern, ttl in intents:
+        if pattern.search(key):
+            return name, ttl
+    return "general", DEFAULT_TTL
+
+
+# Drop-in replacement for the search tool's run(): results are cached under a
+# normalized key (case, whitespace and filler words ignored), expire per
+# intent and are evicted least-recently-used once max_bytes is exceeded. A
+# query that is nothing but filler has no key and is never cached.
+class CachedSearch:
+    def __init__(self, backend, max_bytes=16 * 1024 * 1024, intents=DEFAULT_INTENT_TTLS):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.intents = intents
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (expires_at, result, size, prefetched)
+        self._lock = threading.Lock()
+
+    def run(self, query):
+        key = normalize_query(query)
+        if not key:
+            counters.inc("search_cache_uncacheable")
+            return self.backend.run(query)
+
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        result = self.backend.run(query)
+        self.put(key, result)
+        return result
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                counters.inc("search_cache_hits")
+                if entry[3]:
+                    counters.inc("prefetch_hits")
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+                counters.inc("search_cache_expired")
+        counters.inc("search_cache_misses")
+        return None
+
+    def contains(self, key):
+        # Fresh entry present; unlike get() this is not a lookup for the stats.
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def put(self, key, result, prefetched=False):
+        intent, ttl = query_intent(key, self.intents)
+        size = sys.getsizeof(key) + sys.getsizeof(result)
+        if not key or size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, result, size, prefetched)
+            self.size += size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                counters.inc("search_cache_evictions")
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[2]
+
+    def __len__(self):
+        return len(self._entries)
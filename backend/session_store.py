@@ -0,0 +1,569 @@
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from metrics import counters, gauges, timed
+
+
+logger = logging.getLogger(__name__)
+
+
+class VersionConflict(Exception):
+    pass
+
+
+# Session state keyed by userId. Every write is a compare-and-swap on the
+# version read earlier, so two concurrent turns for the same user cannot
+# silently overwrite each other; the loser re-reads and re-applies its change.
+#
+# get() returns (version, data). A user that was never seen, or whose session
+# timed out, comes back as data=None with the version to swap against.
+class SessionStore:
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def compare_and_set(self, user_id, version, data):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def update(self, user_id, fn, version=None, data=None, retries=10):
+        # fn(data) -> new data, or None to leave the session alone. When the
+        # caller already holds (version, data) the first attempt skips the read.
+        for attempt in range(retries):
+            if attempt or version is None:
+                version, data = self.get(user_id)
+            new_data = fn(data)
+            if new_data is None:
+                return None
+            if self.compare_and_set(user_id, version, new_data):
+                return new_data
+            counters.inc("session_conflicts")
+        raise VersionConflict(f"could not update session {user_id!r} after {retries} attempts")
+
+
+# Expired sessions are hidden on read and removed in a sweep every
+# purge_every writes, so abandoned sessions do not pile up.
+class MemorySessionStore(SessionStore):
+    def __init__(self, timeout=1800, purge_every=1000):
+        self.timeout = timeout
+        self.purge_every = purge_every
+        self._writes = 0
+        self._sessions = {}  # user_id -> (version, expires_at, json)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+        if entry is None:
+            return 0, None
+        version, expires_at, payload = entry
+        if expires_at < time.time():
+            return version, None
+        # Stored serialized so callers never share (and mutate) live objects.
+        return version, json.loads(payload)
+
+    def compare_and_set(self, user_id, version, data):
+        payload = json.dumps(data)
+        with self._lock:
+            current = self._sessions.get(user_id)
+            if (current[0] if current else 0) != version:
+                return False
+            self._sessions[user_id] = (version + 1, time.time() + self.timeout, payload)
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge()
+            return True
+
+    def _purge(self):
+        now = time.time()
+        expired = [user_id for user_id, entry in self._sessions.items() if entry[1] < now]
+        for user_id in expired:
+            del self._sessions[user_id]
+        counters.inc("session_store_expired", len(expired))
+
+    def delete(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+
+# Shared by every worker process on the host through one SQLite file in WAL
+# mode; no outside service needed. Every purge_every writes (per process) the
+# expired rows are deleted.
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path="sessions.db", timeout=1800, purge_every=1000):
+        self.path = path
+        self.timeout = timeout
+        self.purge_every = purge_every
+        self._writes = itertools.count(1)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " user_id TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " data TEXT NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id):
+        row = self._connection().execute(
+            "SELECT version, expires_at, data FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return 0, None
+        version, expires_at, payload = row
+        if expires_at < time.time():
+            return version, None
+        return version, json.loads(payload)
+
+    def compare_and_set(self, user_id, version, data):
+        conn = self._connection()
+        payload = json.dumps(data)
+        expires_at = time.time() + self.timeout
+        if version == 0:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO sessions (user_id, version, expires_at, data) VALUES (?, 1, ?, ?)",
+                (user_id, expires_at, payload),
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE sessions SET version = version + 1, expires_at = ?, data = ?"
+                " WHERE user_id = ? AND version = ?",
+                (expires_at, payload, user_id, version),
+            )
+        if next(self._writes) % self.purge_every == 0:
+            self._purge(conn)
+        return cursor.rowcount == 1
+
+    def _purge(self, conn):
+        cursor = conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+        counters.inc("session_store_expired", cursor.rowcount)
+
+    def delete(self, user_id):
+        self._connection().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+
+# Append-only file of compressed sessions pushed out of memory. It is a cache
+# of this process, not persistence: each process creates its own file in
+# `directory` (named after its pid, so workers never share one) on its first
+# write, which is after the fork when the app is preloaded. The file is
+# rewritten without the dead records once they make up most of it and is
+# deleted on close.
+class SpillFile:
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.path = None
+        self.file = None
+        self.index = {}  # user_id -> (offset, length)
+        self.size = 0
+        self.dead = 0
+
+    def write(self, user_id, blob):
+        if self.file is None:
+            fd, self.path = tempfile.mkstemp(prefix=f"sessions-{os.getpid()}-", suffix=".spill", dir=self.directory)
+            self.file = os.fdopen(fd, "w+b")
+        self.discard(user_id)
+        self.file.seek(self.size)
+        self.file.write(blob)
+        self.index[user_id] = (self.size, len(blob))
+        self.size += len(blob)
+
+    def read(self, user_id):
+        offset, length = self.index[user_id]
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def discard(self, user_id):
+        entry = self.index.pop(user_id, None)
+        if entry is not None:
+            self.dead += entry[1]
+            if self.dead > self.size // 2 and self.dead > 16 * 1024 * 1024:
+                self._compact()
+
+    def _compact(self):
+        compacted = open(self.path + ".compact", "w+b")
+        index = {}
+        offset = 0
+        for user_id, (old_offset, length) in self.index.items():
+            self.file.seek(old_offset)
+            compacted.write(self.file.read(length))
+            index[user_id] = (offset, length)
+            offset += length
+        self.file.close()
+        os.replace(self.path + ".compact", self.path)
+        self.file, self.index, self.size, self.dead = compacted, index, offset, 0
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# In-process store held to a byte budget instead of an entry count. Sessions
+# live in three tiers:
+#
+#   hot    serialized JSON, as in MemorySessionStore (callers always get a
+#          private copy, so a live dict would be copied on every read anyway)
+#   warm   zlib-compressed JSON, once idle for idle_seconds or when the hot
+#          tier outgrows hot_bytes
+#   cold   compressed and spilled to a SpillFile in spill_dir once the
+#          hot + warm tiers outgrow max_bytes; dropped outright when there is
+#          no spill file
+#
+# Every tier is kept in order of last activity and gives up its least
+# recently active sessions first. A read or write makes a session hot again.
+#
+# max_bytes also covers what each session costs to keep track of, in every
+# tier (its key, _Entry, dict and tier slots, and spill index entry), so a
+# budget that only cold sessions fill starts dropping the oldest of them.
+# Allocator overhead and the work of a request in flight are not counted.
+class BoundedSessionStore(SessionStore):
+    HOT, WARM, COLD = "hot", "warm", "cold"
+    # Per-session bookkeeping, measured with tracemalloc on CPython 3.11: an
+    # _Entry with its _sessions and tier slots, and a spill index entry.
+    ENTRY_BYTES = 220
+    SPILL_INDEX_BYTES = 130
+
+    def __init__(self, timeout=1800, max_bytes=256 * 1024 * 1024, hot_bytes=None, idle_seconds=300, spill_dir=None, level=6):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.hot_bytes = hot_bytes if hot_bytes is not None else max_bytes // 4
+        self.idle_seconds = idle_seconds
+        self.level = level
+        self.spill = SpillFile(spill_dir) if spill_dir else None
+        self._sessions = {}  # user_id -> _Entry
+        self._tiers = {self.HOT: OrderedDict(), self.WARM: OrderedDict(), self.COLD: OrderedDict()}
+        self.resident = {self.HOT: 0, self.WARM: 0}
+        self.index_bytes = 0  # bookkeeping of every session, see ENTRY_BYTES
+        self.raw_bytes = 0  # uncompressed size of the warm tier
+        self._lock = threading.Lock()
+
+        gauges.register("session_store_sessions", lambda: len(self._sessions))
+        gauges.register("session_store_hot_bytes", lambda: self.resident[self.HOT])
+        gauges.register("session_store_warm_bytes", lambda: self.resident[self.WARM])
+        gauges.register("session_store_index_bytes", lambda: self.index_bytes)
+        gauges.register("session_store_spilled_bytes", self.spilled_bytes)
+        gauges.register("session_store_compression_ratio", self.compression_ratio)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return 0, None
+            if entry.expires_at < time.time():
+                self._drop(user_id)
+                return entry.version, None
+            payload = self._load(user_id, entry)
+            self._store_hot(user_id, entry, payload)
+            self._enforce()
+            version = entry.version
+        return version, json.loads(payload)
+
+    def compare_and_set(self, user_id, version, data):
+        payload = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if (entry.version if entry else 0) != version:
+                return False
+            if entry is None:
+                entry = self._sessions[user_id] = _Entry()
+                self.index_bytes += sys.getsizeof(user_id) + self.ENTRY_BYTES
+            entry.version = version + 1
+            entry.expires_at = time.time() + self.timeout
+            self._store_hot(user_id, entry, payload)
+            self._enforce()
+            return True
+
+    def delete(self, user_id):
+        with self._lock:
+            if user_id in self._sessions:
+                self._drop(user_id)
+
+    def compression_ratio(self):
+        return self.raw_bytes / self.resident[self.WARM] if self.resident[self.WARM] else 0.0
+
+    def spilled_bytes(self):
+        return self.spill.size - self.spill.dead if self.spill else 0
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                **{f"{tier}_sessions": len(order) for tier, order in self._tiers.items()},
+                "hot_bytes": self.resident[self.HOT],
+                "warm_bytes": self.resident[self.WARM],
+                "index_bytes": self.index_bytes,
+                "resident_bytes": self.resident[self.HOT] + self.resident[self.WARM] + self.index_bytes,
+                "spilled_bytes": self.spilled_bytes(),
+                "compression_ratio": round(self.compression_ratio(), 2),
+            }
+
+    # The helpers below run under self._lock.
+
+    def _load(self, user_id, entry):
+        if entry.tier == self.HOT:
+            return entry.payload
+        if entry.tier == self.WARM:
+            return zlib.decompress(entry.payload).decode()
+        return zlib.decompress(self.spill.read(user_id)).decode()
+
+    def _store_hot(self, user_id, entry, payload):
+        if entry.tier is not None and entry.tier != self.HOT:
+            counters.inc("session_store_promotions")
+        self._release(user_id, entry)
+        entry.touched_at = time.monotonic()
+        self._place(user_id, entry, self.HOT, payload, sys.getsizeof(payload))
+
+    def _place(self, user_id, entry, tier, payload, size, raw=0):
+        entry.tier, entry.payload, entry.size, entry.raw = tier, payload, size, raw
+        self._tiers[tier][user_id] = None
+        if tier in self.resident:
+            self.resident[tier] += size
+        else:
+            self.index_bytes += self.SPILL_INDEX_BYTES
+        self.raw_bytes += raw
+
+    def _release(self, user_id, entry):
+        # Take the entry out of its tier and forget its bytes.
+        if entry.tier is None:
+            return
+        del self._tiers[entry.tier][user_id]
+        if entry.tier in self.resident:
+            self.resident[entry.tier] -= entry.size
+        elif entry.tier == self.COLD:
+            self.spill.discard(user_id)
+            self.index_bytes -= self.SPILL_INDEX_BYTES
+        self.raw_bytes -= entry.raw
+        entry.tier, entry.payload, entry.size, entry.raw = None, None, 0, 0
+
+    def _drop(self, user_id):
+        self._release(user_id, self._sessions.pop(user_id))
+        self.index_bytes -= sys.getsizeof(user_id) + self.ENTRY_BYTES
+
+    def _enforce(self):
+        now = time.monotonic()
+        hot = self._tiers[self.HOT]
+        while hot:
+            user_id = next(iter(hot))
+            entry = self._sessions[user_id]
+            if self.resident[self.HOT] <= self.hot_bytes and now - entry.touched_at < self.idle_seconds:
+                break
+            payload = entry.payload
+            self._release(user_id, entry)
+            blob = zlib.compress(payload.encode(), self.level)
+            self._place(user_id, entry, self.WARM, blob, sys.getsizeof(blob), len(payload))
+            counters.inc("session_store_compressions")
+
+        while self.resident[self.HOT] + self.resident[self.WARM] + self.index_bytes > self.max_bytes:
+            tier = self._tiers[self.WARM] or self._tiers[self.HOT]
+            if not tier:
+                # Only the bookkeeping of spilled sessions is left to give up.
+                self._drop(next(iter(self._tiers[self.COLD])))
+                counters.inc("session_store_evictions")
+                continue
+            user_id = next(iter(tier))
+            entry = self._sessions[user_id]
+            if self.spill is None or entry.expires_at < time.time():
+                self._drop(user_id)
+                counters.inc("session_store_evictions")
+                continue
+            blob = entry.payload if entry.tier == self.WARM else zlib.compress(entry.payload.encode(), self.level)
+            self._release(user_id, entry)
+            self.spill.write(user_id, blob)
+            self._place(user_id, entry, self.COLD, None, 0)
+            counters.inc("session_store_spills")
+
+        # Sessions nobody came back for; the coldest are the oldest.
+        cold = self._tiers[self.COLD]
+        wall = time.time()
+        while cold:
+            user_id = next(iter(cold))
+            if self._sessions[user_id].expires_at >= wall:
+                break
+            self._drop(user_id)
+            counters.inc("session_store_expired")
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class _Entry:
+    __slots__ = ("version", "expires_at", "touched_at", "tier", "payload", "size", "raw")
+
+    def __init__(self):
+        self.version = 0
+        self.expires_at = 0.0
+        self.touched_at = 0.0
+        self.tier = None
+        self.payload = None
+        self.size = 0
+        self.raw = 0
+
+
+# Carries an in-process store (memory, bounded) across restarts. Writes are
+# remembered as dirty and a background thread copies the sessions that
+# changed since the last pass to a SQLite file every `interval` seconds;
+# close() makes a final pass. Nothing is loaded at startup: a session is read
+# back from the file on its first get() miss, so a restart costs the same
+# however many sessions were saved.
+#
+# Sessions a BoundedSessionStore evicted come back the same way.
+class SnapshotSessionStore(SessionStore):
+    def __init__(self, inner, path="sessions.snapshot.db", interval=5.0):
+        self.inner = inner
+        self.path = path
+        self.interval = interval
+        self._dirty = {}  # user_id -> (expires_at, json), None once deleted
+        self._lock = threading.Lock()  # inner writes and _dirty, kept in step
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " user_id TEXT PRIMARY KEY,"
+            " expires_at REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-snapshot", daemon=True)
+        self._thread.start()
+
+        gauges.register("session_snapshot_dirty", lambda: len(self._dirty))
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id):
+        version, data = self.inner.get(user_id)
+        if data is not None or version:
+            return version, data
+        restored = self._restore(user_id)
+        if restored is None:
+            return 0, None
+        # A concurrent restore of the same session may win; either copy is it.
+        if self.compare_and_set(user_id, 0, restored):
+            counters.inc("session_restores")
+        return self.inner.get(user_id)
+
+    def compare_and_set(self, user_id, version, data):
+        payload = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            if not self.inner.compare_and_set(user_id, version, data):
+                return False
+            self._dirty[user_id] = (time.time() + self.inner.timeout, payload)
+        return True
+
+    def delete(self, user_id):
+        with self._lock:
+            self.inner.delete(user_id)
+            self._dirty[user_id] = None
+
+    def _restore(self, user_id):
+        # The flush lock keeps a batch that is being written visible: either
+        # it is still in _dirty or it is in the file.
+        with self._flush_lock:
+            with self._lock:
+                if user_id in self._dirty:
+                    entry = self._dirty[user_id]
+                    return json.loads(entry[1]) if entry is not None else None
+            row = self._connection().execute(
+                "SELECT expires_at, data FROM snapshots WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return json.loads(row[1])
+
+    def flush(self):
+        # Writes the sessions changed since the last flush; returns how many.
+        with self._flush_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+            if not batch:
+                return 0
+            conn = self._connection()
+            try:
+                with timed("session_snapshot"):
+                    conn.execute("BEGIN")
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO snapshots (user_id, expires_at, data) VALUES (?, ?, ?)",
+                        [(user_id, *entry) for user_id, entry in batch.items() if entry is not None],
+                    )
+                    conn.executemany(
+                        "DELETE FROM snapshots WHERE user_id = ?",
+                        [(user_id,) for user_id, entry in batch.items() if entry is None],
+                    )
+                    conn.execute("DELETE FROM snapshots WHERE expires_at < ?", (time.time(),))
+                    conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Retried with the next flush, unless written again meanwhile.
+                with self._lock:
+                    for user_id, entry in batch.items():
+                        self._dirty.setdefault(user_id, entry)
+                raise
+        counters.inc("session_snapshot_writes", len(batch))
+        return len(batch)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.warning("session snapshot failed", exc_info=True)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        # Fold the WAL into the database, so the next start has nothing to replay.
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if hasattr(self.inner, "close"):
+            self.inner.close()
+
+
+def create_session_store(kind="memory", path="sessions.db", timeout=1800, snapshot_path=None, snapshot_interval=5.0, **options):
+    if kind == "memory":
+        store = MemorySessionStore(timeout=timeout)
+    elif kind == "sqlite":
+        return SQLiteSessionStore(path=path, timeout=timeout)
+    elif kind == "bounded":
+        store = BoundedSessionStore(timeout=timeout, **options)
+    else:
+        raise ValueError(f"unknown session store {kind!r}")
+    # SQLite sessions already outlive the process.
+    if snapshot_path:
+        return SnapshotSessionStore(store, path=snapshot_path, interval=snapshot_interval)
+    return store
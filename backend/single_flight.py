@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from metrics import counters
+
+
+class _UserQueue:
+    def __init__(self):
+        self.next_ticket = 0
+        self.serving = 0
+        self.flights = {}  # key -> Future of the queued or running turn
+        self.cond = threading.Condition()
+
+
+class Flight:
+    def __init__(self, future, leader):
+        self.future = future
+        self.leader = leader
+
+    def set_result(self, result):
+        self.future.set_result(result)
+
+    def set_exception(self, exception):
+        self.future.set_exception(exception)
+
+    def result(self):
+        return self.future.result()
+
+
+# Per-user turn coalescing. A turn whose key (the user input) matches one that
+# is already queued or running for the same user joins it and gets the same
+# result instead of running the pipeline again; that's the retry and
+# double-click case. Different turns for one user run one at a time, in
+# arrival order (ticket lock), so each one starts from the state the previous
+# one stored.
+class SingleFlight:
+    def __init__(self):
+        self._queues = {}  # user_id -> _UserQueue, only while turns are pending
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def claim(self, user_id, key):
+        # Yields a Flight. The leader runs the turn (it is its user's turn when
+        # the block starts) and calls set_result(); a follower just waits on
+        # result().
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is None:
+                queue = self._queues[user_id] = _UserQueue()
+            future = queue.flights.get(key)
+            if future is None:
+                future = queue.flights[key] = Future()
+                ticket = queue.next_ticket
+                queue.next_ticket += 1
+            else:
+                ticket = None
+
+        if ticket is None:
+            counters.inc("turns_deduplicated")
+            yield Flight(future, leader=False)
+            return
+
+        with queue.cond:
+            if queue.serving != ticket:
+                counters.inc("turns_queued")
+            while queue.serving != ticket:
+                queue.cond.wait()
+
+        try:
+            yield Flight(future, leader=True)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.set_exception(RuntimeError("turn ended without a result"))
+            with self._lock:
+                del queue.flights[key]
+                with queue.cond:
+                    queue.serving += 1
+                    queue.cond.notify_all()
+                if queue.serving == queue.next_ticket:
+                    del self._queues[user_id]
+
+    def run(self, user_id, key, fn):
+        with self.claim(user_id, key) as flight:
+            if flight.leader:
+                flight.set_result(fn())
+            return flight.result()
+
+    def __len__(self):
+        return len(self._queues)
+
+
+class _AsyncUserQueue:
+    def __init__(self):
+        self.pending = 0
+        self.tail = None  # Future that resolves when the last queued turn is done
+        self.flights = {}  # key -> Future of the queued or running turn
+
+
+# SingleFlight for the ASGI app: the same coalescing and per-user order, but
+# waiting turns await instead of blocking a thread. fn is a coroutine function.
+# Used from one event loop only.
+class AsyncSingleFlight:
+    def __init__(self):
+        self._queues = {}  # user_id -> _AsyncUserQueue, only while turns are pending
+
+    async def run(self, user_id, key, fn):
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = _AsyncUserQueue()
+        future = queue.flights.get(key)
+        if future is not None:
+            counters.inc("turns_deduplicated")
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = queue.flights[key] = loop.create_future()
+        previous, done = queue.tail, loop.create_future()
+        queue.tail = done
+        queue.pending += 1
+        try:
+            if previous is not None and not previous.done():
+                counters.inc("turns_queued")
+                await asyncio.shield(previous)
+            future.set_result(await fn())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            if not future.done():
+                # Cancelled: followers get an error, the cancellation goes on.
+                future.set_exception(RuntimeError("turn ended without a result"))
+                future.exception()
+            del queue.flights[key]
+            # A turn cancelled while it waited still lets the next one start
+            # only after the one ahead of it.
+            if previous is None or previous.done():
+                done.set_result(None)
+            else:
+                previous.add_done_callback(lambda _: done.set_result(None))
+            queue.pending -= 1
+            if queue.pending == 0:
+                del self._queues[user_id]
+        return future.result()
+
+    def __len__(self):
+        return len(self._queues)
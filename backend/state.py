@@ -0,0 +1,311 @@
+import copy
+
+from state_patch import escape
+
+
+# Nested state template every session starts from. An empty {} means "not
+# answered yet".
+initialJson = {
+    "Origin_city": {},
+    "budget": {},
+    "destination": [],
+    "firstDestination": {},
+    "food": {},
+    "optimizeType": {},
+    "time_schedule": {
+      "duration": {
+        "unit": {},
+        "value": {}
+      },
+      "onward_trip": {
+        "date": {
+          "day_of_month": {},
+          "month": {},
+          "year": {}
+        },
+        "time": {
+          "hour": {},
+          "minute": {}
+        }
+      },
+      "return_trip": {
+        "date": {
+          "day_of_month": {},
+          "month": {},
+          "year": {}
+        },
+        "time": {
+          "hour": {},
+          "minute": {}
+        }
+      }
+    },
+    "traveller_type": {},
+    "trip_direction": {},
+    "trip_theme": {},
+    "user_interests": {
+      "adult": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "any": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "beach": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "city-sightseeing": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "culture and traditions": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "dark tourism": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "food and wine": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "historical": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "kids entertainment": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "nature": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "nightlife": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "outdoors and sports": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "religion": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "science and technology": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "shopping": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      },
+      "theatre and concert": {
+        "places": [],
+        "user_keywords": [],
+        "user_selected": False,
+        "weight": 0
+      }
+    }
+  }
+
+
+# Flat key for a nested path, e.g. ("time_schedule", "onward_trip", "time",
+# "hour") -> "time_schedule_onward_trip_time_hour". Interests are flattened
+# under the singular "user_interest_" prefix the prompt and the model use.
+def flat_key(path):
+    if path[0] == "user_interests":
+        path = ("user_interest",) + path[1:]
+    return "_".join(path)
+
+
+# A field counts as unanswered while it still holds its template value. Types
+# are compared too, since 0 == False and 1 == True in Python.
+def is_default(value, default):
+    return type(value) is type(default) and value == default
+
+
+# Compiles a nested template into flatten/unflatten functions. The path table
+# (flat key -> nested path) is computed once, and each direction becomes one
+# generated function: a single dict display, no per-key loops, no throwaway
+# dicts and no parsing of flat key names (interest names may contain spaces,
+# dashes or underscores).
+class StateSchema:
+    def __init__(self, template):
+        self.template = template
+        self.paths = {}  # flat key -> nested path
+        self.defaults = {}  # flat key -> template value
+        self._walk(template, ())
+        self.order = {key: position for position, key in enumerate(self.paths)}
+        self.flatten = self._compile_flatten()
+        self.unflatten = self._compile_unflatten()
+        self.blank = self._compile_blank()
+
+    def _walk(self, node, path):
+        for key, value in node.items():
+            if isinstance(value, dict) and value:
+                self._walk(value, path + (key,))
+            else:
+                self.paths[flat_key(path + (key,))] = path + (key,)
+                self.defaults[flat_key(path + (key,))] = value
+
+    def _default(self, key):
+        # Source for a fresh copy of the template value (mutable ones must not
+        # be shared between sessions).
+        return repr(self.defaults[key])
+
+    def _compile_flatten(self):
+        # Fast path indexes straight into the nested document; a document that
+        # is missing parts falls back to a walk that fills in template defaults.
+        lines = ["def flatten(nested):", "    try:"]
+        names = {(): "nested"}
+        for path in self.paths.values():
+            for depth in range(1, len(path)):
+                prefix = path[:depth]
+                if prefix not in names:
+                    names[prefix] = f"n{len(names)}"
+                    lines.append(f"        {names[prefix]} = {names[prefix[:-1]]}[{prefix[-1]!r}]")
+        lines.append("        return {")
+        for key, path in self.paths.items():
+            lines.append(f"            {key!r}: {names[path[:-1]]}[{path[-1]!r}],")
+        lines.append("        }")
+        lines.append("    except (KeyError, TypeError):")
+        lines.append("        return flatten_partial(nested)")
+        return self._define("\n".join(lines), "flatten")
+
+    def _compile_unflatten(self):
+        lines = ["def unflatten(flat):", "    return " + self._nested_source(self.template, (), 1)]
+        return self._define("\n".join(lines), "unflatten")
+
+    def _compile_blank(self):
+        # Flat template with fresh copies of the mutable defaults.
+        items = "".join(f"\n        {key!r}: {self._default(key)}," for key in self.paths)
+        return self._define("def blank():\n    return {" + items + "\n    }", "blank")
+
+    def _nested_source(self, node, path, depth):
+        indent = "    " * (depth + 1)
+        items = []
+        for key, value in node.items():
+            if isinstance(value, dict) and value:
+                source = self._nested_source(value, path + (key,), depth + 1)
+            else:
+                flat = flat_key(path + (key,))
+                source = f"flat[{flat!r}] if {flat!r} in flat else {self._default(flat)}"
+            items.append(f"{indent}{key!r}: {source},")
+        return "{\n" + "\n".join(items) + "\n" + "    " * depth + "}"
+
+    def _define(self, source, name):
+        namespace = {"flatten_partial": self.flatten_partial}
+        exec(compile(source, f"<StateSchema.{name}>", "exec"), namespace)
+        return namespace[name]
+
+    def flatten_partial(self, nested):
+        flat = {}
+        for key, path in self.paths.items():
+            node = nested
+            for part in path:
+                if not isinstance(node, dict) or part not in node:
+                    node = copy.deepcopy(self.defaults[key])
+                    break
+                node = node[part]
+            flat[key] = node
+        return flat
+
+
+    def sparse(self, flat):
+        # Only the answered fields of a flat state, in template order.
+        defaults = self.defaults
+        return SparseState(self, tuple(
+            (key, value) for key, value in flat.items()
+            if key in defaults and not is_default(value, defaults[key])
+        ))
+
+    def load(self, pairs):
+        # From the [[key, value], ...] list a session stores.
+        order = self.order
+        return SparseState(self, tuple(sorted(
+            ((key, value) for key, value in pairs if key in order), key=lambda pair: order[pair[0]]
+        )))
+
+    def patch(self, before, after):
+        # JSON patch between the nested views of two states (what a key by
+        # key diff of the two documents gives), built from the changed fields
+        # without materializing either document.
+        old, new = dict(before.fields), dict(after.fields)
+        ops = []
+        for key in self.paths:
+            if key not in old and key not in new:
+                continue
+            value = new[key] if key in new else self.defaults[key]
+            if key in old and key in new and old[key] == value and type(old[key]) is type(value):
+                continue
+            pointer = "".join("/" + escape(part) for part in self.paths[key])
+            ops.append({"op": "replace", "path": pointer, "value": copy.deepcopy(value)})
+        return ops
+
+
+# A session's state as the fields that differ from the template, instead of
+# the whole nested document (16 interest blocks and a dozen {} placeholders
+# for a user who has answered three questions). The flat view a turn works on
+# and the nested one sent to the client are built from it on demand; the
+# nested one at most once.
+class SparseState:
+    __slots__ = ("schema", "fields", "_nested")
+
+    def __init__(self, schema, fields=()):
+        self.schema = schema
+        self.fields = fields  # ((flat key, value), ...) in template order
+        self._nested = None
+
+    def flat(self):
+        flat = self.schema.blank()
+        # Lists are the only values a turn changes in place.
+        flat.update((key, list(value) if isinstance(value, list) else value) for key, value in self.fields)
+        return flat
+
+    def nested(self):
+        if self._nested is None:
+            self._nested = self.schema.unflatten(dict(self.fields))
+        return self._nested
+
+    def dump(self):
+        return [list(pair) for pair in self.fields]
+
+
+state_schema = StateSchema(initialJson)
+flatten_json = state_schema.flatten
+unflatten_json = state_schema.unflatten
@@ -0,0 +1,3 @@
+# JSON pointer escaping (RFC 6901) for the paths of the state patches.
+def escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
@@ -0,0 +1,79 @@
+import json
+import re
+
+
+_NEXT_REPLY_KEY = re.compile(r'"next_reply"\s*:\s*"')
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+# Pulls the "next_reply" string out of the model's JSON while it is still being
+# generated. feed() takes raw completion chunks and returns whatever part of
+# the reply became decodable, so the UI can show it before the object closes.
+class NextReplyExtractor:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None  # index of the next undecoded char inside the value
+        self.done = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.done:
+            return ""
+
+        if self.pos is None:
+            match = _NEXT_REPLY_KEY.search(self.buffer)
+            if not match:
+                return ""
+            self.pos = match.end()
+
+        out = []
+        buffer, pos = self.buffer, self.pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != "\\":
+                out.append(char)
+                pos += 1
+                continue
+
+            # Escapes may be split across chunks; wait for the rest.
+            if pos + 1 >= len(buffer):
+                break
+            code = buffer[pos + 1]
+            if code != "u":
+                out.append(_ESCAPES.get(code, code))
+                pos += 2
+                continue
+            if pos + 6 > len(buffer):
+                break
+            codepoint = int(buffer[pos + 2:pos + 6], 16)
+            if 0xD800 <= codepoint < 0xDC00:
+                # High surrogate, needs its low half before it can be emitted.
+                if pos + 12 > len(buffer):
+                    break
+                low = int(buffer[pos + 8:pos + 12], 16)
+                codepoint = 0x10000 + ((codepoint - 0xD800) << 10) + (low - 0xDC00)
+                pos += 12
+            else:
+                pos += 6
+            out.append(chr(codepoint))
+
+        self.pos = pos
+        return "".join(out)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
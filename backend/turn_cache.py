@@ -0,0 +1,16 @@
+import hashlib
+import json
+
+
+# Key for the turn-level response cache: the last few history lines
+# (normalized), the flattened state and the user input. Two sessions in the
+# same place with the same input get the same key, e.g. every fresh session
+# saying "hi".
+def turn_cache_key(chat_history, current_json, user_input, history_turns=4):
+    recent = [" ".join(line.lower().split()) for line in chat_history[-history_turns:]]
+    payload = json.dumps(
+        [recent, current_json, " ".join(user_input.lower().split())],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
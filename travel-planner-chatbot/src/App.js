@@ -1,12 +1,14 @@
 import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 import { useParams } from 'react-router-dom';
+import { applyJsonPatch } from './jsonPatch';
 import './App.css';
 
 const App = () => {
     const { userId } = useParams(); // Get the unique user ID from the URL
     const [chatHistory, setChatHistory] = useState([]);
     const [jsonData, setJsonData] = useState({});
+    const [stateVersion, setStateVersion] = useState(null); // Version of jsonData, lets the server send patches
     const [userInput, setUserInput] = useState('');
     const [options, setOptions] = useState([]);
     const [loading, setLoading] = useState(false); // Loader state
@@ -20,6 +22,7 @@ const App = () => {
             try {
                 const response = await axios.post(`http://127.0.0.1:5000/api/initialize`, { userId });
                 setJsonData(response.data.current_json);
+                setStateVersion(response.data.state_version ?? null);
                 setChatHistory(response.data.chat_history || []);
                 setOptions(response.data.options || []);
                 checkDataCompleteness(response.data.current_json); // Check completeness
@@ -50,19 +53,49 @@ const App = () => {
         setChatHistory(newChatHistory);
         setUserInput('');
 
-        setLoading(true); // Start loader
-        const response = await callOpenAIApi(userInput);
-        setLoading(false); // Stop loader
+        await sendMessage(userInput, newChatHistory);
+    };
+
+    const handleOptionClick = async (option) => {
+        const newChatHistory = [...chatHistory, `User: ${option}`];
+        setOptions([]);
+        setChatHistory(newChatHistory);
+
+        await sendMessage(option, newChatHistory);
+    };
 
-        // Simulate bot typing effect
-        setIsBotTyping(true);
+    const sendMessage = async (message, newChatHistory) => {
+        setLoading(true); // Start loader until the first token arrives
         setTypingMessage(''); // Clear any previous message
-        await simulateTyping(response?.next_reply || '');
+
+        let streamed = '';
+        const response = await streamOpenAIApi(message, (text) => {
+            if (!streamed) {
+                setLoading(false);
+                setIsBotTyping(true);
+            }
+            streamed += text;
+            setTypingMessage(streamed);
+        });
+        setLoading(false); // Stop loader
+
+        if (!streamed) {
+            // Nothing was streamed (e.g. an error), fall back to the typing effect
+            setIsBotTyping(true);
+            await simulateTyping(response?.next_reply || '');
+        }
+        setIsBotTyping(false);
+
+        // The server sends a patch against our version when it can, the full state otherwise
+        const currentJson = response?.current_json_patch
+            ? applyJsonPatch(jsonData, response.current_json_patch)
+            : response?.current_json;
 
         setChatHistory([...newChatHistory, `Bot: ${response?.next_reply}`]);
-        setJsonData(response?.current_json);
+        setJsonData(currentJson);
+        setStateVersion(response?.state_version ?? null);
         setOptions(response?.options);
-        checkDataCompleteness(response?.current_json); // Check completeness
+        checkDataCompleteness(currentJson); // Check completeness
     };
 
     const simulateTyping = async (message) => {
@@ -73,45 +106,61 @@ const App = () => {
         setIsBotTyping(false);
     };
 
-    const handleOptionClick = async (option) => {
-        const newChatHistory = [...chatHistory, `User: ${option}`];
-        setOptions([]);
-        setChatHistory(newChatHistory);
+    // Reads the Server-Sent Events from /api/chat/stream: "token" events carry
+    // pieces of the reply, "done" carries the final state.
+    const streamOpenAIApi = async (userInput, onToken) => {
+        const failure = {
+            current_json: jsonData,
+            next_reply: "I'm sorry, I couldn't process your request. Please try again.",
+            options: []
+        };
 
-        setLoading(true); // Start loader
-        const response = await callOpenAIApi(newChatHistory);
-        setLoading(false); // Stop loader
+        try {
+            const response = await fetch(`http://127.0.0.1:5000/api/chat/stream`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ userInput, userId, stateVersion })
+            });
+            if (!response.ok || !response.body) {
+                return failure;
+            }
 
-        // Simulate bot typing effect
-        setIsBotTyping(true);
-        setTypingMessage(''); // Clear any previous message
-        await simulateTyping(response?.next_reply || '');
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let result = failure;
 
-        setChatHistory([...newChatHistory, `Bot: ${response?.next_reply}`]);
-        setJsonData(response?.current_json);
-        setOptions(response?.options);
-        checkDataCompleteness(response?.current_json); // Check completeness
-    };
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
 
-    const callOpenAIApi = async (userInput) => {
-        try {
-            const response = await axios.post(`http://127.0.0.1:5000/api/chat`, {
-                userInput,
-                userId
-            });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
 
-            return {
-                current_json: response.data.current_json,
-                next_reply: response.data.next_reply,
-                options: response.data.options
-            };
+                    let event = 'message';
+                    let data = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) data += line.slice(6);
+                    });
+
+                    const payload = JSON.parse(data);
+                    if (event === 'token') {
+                        onToken(payload.text);
+                    } else if (event === 'done') {
+                        result = payload;
+                    } else if (event === 'error') {
+                        console.error("Error calling OpenAI API:", payload.error);
+                    }
+                }
+            }
+            return result;
         } catch (error) {
             console.error("Error calling OpenAI API:", error);
-            return {
-                current_json: jsonData,
-                next_reply: "I'm sorry, I couldn't process your request. Please try again.",
-                options: []
-            };
+            return failure;
         }
     };
 
@@ -0,0 +1,26 @@
+// src/jsonPatch.js
+// Applies the RFC 6902 patches the backend sends for current_json
+// (add / remove / replace). Returns a new object; the input is left untouched.
+
+const unescape = (token) => token.replace(/~1/g, '/').replace(/~0/g, '~');
+
+export const applyJsonPatch = (document, patch) => {
+  const result = JSON.parse(JSON.stringify(document ?? {}));
+
+  patch.forEach(({ op, path, value }) => {
+    const tokens = path.split('/').slice(1).map(unescape);
+    const key = tokens.pop();
+    const parent = tokens.reduce((node, token) => node[token], result);
+
+    if (op === 'remove') {
+      if (Array.isArray(parent)) parent.splice(Number(key), 1);
+      else delete parent[key];
+    } else if (op === 'add' && Array.isArray(parent)) {
+      parent.splice(key === '-' ? parent.length : Number(key), 0, value);
+    } else {
+      parent[key] = value;
+    }
+  });
+
+  return result;
+};